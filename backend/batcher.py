@@ -0,0 +1,116 @@
+# backend/batcher.py
+"""
+Dynamic micro-batching of RAG retrievals across concurrent requests.
+
+Each chat request awaits RetrievalBatcher.retrieve(); queries arriving within
+`max_wait_ms` of each other (up to `max_batch`) are embedded with one
+batched encode in a worker thread, and every caller gets back its own hits.
+The search is split by (k, filters), since one retrieve_batch call shares
+both; with per-location geo filters that is often one group per query, so
+the groups reuse the batch's embeddings and are searched concurrently.
+"""
+
+import asyncio
+import functools
+from collections import defaultdict
+
+from .rag import filter_key
+
+
+class RetrievalBatcher:
+    def __init__(self, rag, max_batch=32, max_wait_ms=5.0, executor=None):
+        self.rag = rag
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self._queue = None
+        self._worker = None
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_worker(self):
+        # the queue and worker are bound to the running event loop, so create them lazily
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def retrieve(self, query: str, k=3, filters=None):
+        self._ensure_worker()
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, k, filters, fut))
+        return await fut
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [item for item in await self._collect() if not item[-1].done()]
+            if not batch:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+
+            queries = list(dict.fromkeys(self.rag.dense_queries([item[0] for item in batch])))
+            embeddings = None
+            if queries:
+                try:
+                    embs = await loop.run_in_executor(self.executor, self.rag.embed_queries, queries)
+                except Exception as e:
+                    self._fail(batch, e)
+                    continue
+                embeddings = dict(zip(queries, embs))
+
+            groups = defaultdict(list)
+            for item in batch:
+                groups[(item[1], filter_key(item[2]))].append(item)
+            await asyncio.gather(*(self._search(items, embeddings) for items in groups.values()))
+
+    async def _search(self, items, embeddings):
+        queries = [q for q, _, _, _ in items]
+        k, filters = items[0][1], items[0][2]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor,
+                functools.partial(self.rag.retrieve_batch, queries, k, filters=filters, embeddings=embeddings),
+            )
+        except Exception as e:
+            self._fail(items, e)
+            return
+        for (_, _, _, fut), hits in zip(items, results):
+            if not fut.done():
+                fut.set_result(hits)
+
+    @staticmethod
+    def _fail(items, exc):
+        for _, _, _, fut in items:
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
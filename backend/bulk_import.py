@@ -0,0 +1,267 @@
+# backend/bulk_import.py
+"""
+Bulk purchase import / backfill.
+
+    python -m backend.bulk_import exports/purchases.csv
+    python -m backend.bulk_import exports/purchases.jsonl --chunk-size 100000
+
+Rows need user_id, store_name and category; amount defaults to 0 and
+timestamp (ISO 8601) to the import time; rows missing any of the required
+fields (or with them empty), and JSONL lines that don't parse, are skipped.
+Input is streamed and inserted in chunks with executemany, one transaction
+per chunk. The byte offset reached is checkpointed in the same transaction
+(table import_checkpoint, keyed by the source path), so an interrupted run
+resumes exactly after the last committed chunk. The purchase ids each chunk
+got are recorded too (import_chunk), so --restart deletes the rows of the
+earlier run before importing the file again. Purchase indexes are dropped
+for the load and rebuilt at the end, followed by the per-user profiles.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import text
+
+from .db import Purchase, engine, init_db, rebuild_user_profiles
+
+INSERT_SQL = "INSERT INTO purchase (user_id, store_name, category, amount, timestamp) VALUES (?, ?, ?, ?, ?)"
+REQUIRED_FIELDS = ("user_id", "store_name", "category")
+
+
+# -------------------------
+# Input streaming
+# -------------------------
+class _OffsetLines:
+    """Iterate decoded lines of a binary file while tracking the byte offset consumed"""
+
+    def __init__(self, f, offset=0):
+        self.f = f
+        self.offset = offset
+        f.seek(offset)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.f.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode("utf-8")
+
+
+def _read_csv_header(path):
+    with open(path, "rb") as f:
+        lines = _OffsetLines(f)
+        header = next(csv.reader(lines))
+        return [h.strip() for h in header], lines.offset
+
+
+def iter_records(path, fmt, offset):
+    """Yield (record_dict, byte_offset_after_record) starting at `offset`"""
+    with open(path, "rb") as f:
+        if fmt == "csv":
+            header, header_end = _read_csv_header(path)
+            lines = _OffsetLines(f, max(offset, header_end))
+            for values in csv.reader(lines):
+                if values:
+                    yield dict(zip(header, values)), lines.offset
+        else:
+            lines = _OffsetLines(f, offset)
+            for line in lines:
+                line = line.strip()
+                if line:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        rec = None  # to_row rejects it, so it is counted as skipped
+                    yield rec, lines.offset
+
+
+def _timestamp(value, default):
+    if not value:
+        return default
+    ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    # same text layout SQLAlchemy uses for SQLite DateTime columns
+    return ts.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def to_row(rec, default_ts):
+    """Insert parameters for a record; KeyError / TypeError / ValueError for a malformed one"""
+    for field in REQUIRED_FIELDS:
+        if rec[field] is None or not str(rec[field]).strip():
+            raise ValueError(f"empty {field}")
+    return (
+        rec["user_id"],
+        rec["store_name"],
+        rec["category"],
+        float(rec.get("amount") or 0.0),
+        _timestamp(rec.get("timestamp"), default_ts),
+    )
+
+
+# -------------------------
+# Index management
+# -------------------------
+def drop_purchase_indexes():
+    with engine.begin() as conn:
+        for index in Purchase.__table__.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_purchase_user_id"))  # pre-composite single-column index
+
+
+# -------------------------
+# Checkpoints
+# -------------------------
+CHECKPOINT_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS import_checkpoint (
+        source  TEXT PRIMARY KEY,
+        "offset" INTEGER NOT NULL,
+        rows    INTEGER NOT NULL,
+        skipped INTEGER NOT NULL,
+        done    INTEGER NOT NULL DEFAULT 0
+    )""",
+    # purchase ids inserted by each committed chunk, for --restart
+    """CREATE TABLE IF NOT EXISTS import_chunk (
+        source   TEXT NOT NULL,
+        first_id INTEGER NOT NULL,
+        last_id  INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_import_chunk_source ON import_chunk (source)",
+)
+
+
+def load_checkpoint(source, restart=False):
+    """restart=True also deletes the purchases an earlier run of this source inserted"""
+    source = os.path.abspath(source)
+    with engine.begin() as conn:
+        for statement in CHECKPOINT_SCHEMA:
+            conn.exec_driver_sql(statement)
+        if restart:
+            ranges = conn.exec_driver_sql(
+                "SELECT first_id, last_id FROM import_chunk WHERE source = ?", (source,)
+            ).fetchall()
+            if ranges:
+                conn.exec_driver_sql("DELETE FROM purchase WHERE id BETWEEN ? AND ?", [tuple(r) for r in ranges])
+            conn.exec_driver_sql("DELETE FROM import_chunk WHERE source = ?", (source,))
+            conn.exec_driver_sql("DELETE FROM import_checkpoint WHERE source = ?", (source,))
+        row = conn.exec_driver_sql(
+            'SELECT "offset", rows, skipped, done FROM import_checkpoint WHERE source = ?', (source,)
+        ).fetchone()
+    if row is None:
+        return {"source": source, "offset": 0, "rows": 0, "skipped": 0, "done": False}
+    return {"source": source, "offset": row[0], "rows": row[1], "skipped": row[2], "done": bool(row[3])}
+
+
+def record_chunk(conn, source, n_rows):
+    """Remember the ids of the `n_rows` purchases just inserted on `conn` (consecutive within one transaction)"""
+    last_id = conn.exec_driver_sql("SELECT last_insert_rowid()").scalar()
+    conn.exec_driver_sql(
+        "INSERT INTO import_chunk (source, first_id, last_id) VALUES (?, ?, ?)",
+        (source, last_id - n_rows + 1, last_id),
+    )
+
+
+def save_checkpoint(conn, cp):
+    """Record progress inside `conn`'s transaction, so it commits together with the rows it covers"""
+    conn.exec_driver_sql(
+        'INSERT OR REPLACE INTO import_checkpoint (source, "offset", rows, skipped, done) VALUES (?, ?, ?, ?, ?)',
+        (cp["source"], cp["offset"], cp["rows"], cp["skipped"], int(cp["done"])),
+    )
+
+
+# -------------------------
+# Import
+# -------------------------
+def bulk_import(path, fmt=None, chunk_size=50_000, restart=False, drop_indexes=True, rebuild_profiles=True, log=sys.stderr):
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    init_db()
+    cp = load_checkpoint(path, restart)
+    if cp["done"]:
+        print(f"{path} already imported ({cp['rows']} rows); pass --restart to re-run", file=log)
+        return cp
+
+    if drop_indexes:
+        drop_purchase_indexes()
+
+    default_ts = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+    started = time.perf_counter()
+    start_rows = cp["rows"]
+    chunk = []
+    offset = cp["offset"]
+
+    def flush():
+        progress = {**cp, "rows": cp["rows"] + len(chunk), "offset": offset}
+        with engine.begin() as conn:
+            if chunk:
+                conn.exec_driver_sql(INSERT_SQL, chunk)
+                record_chunk(conn, cp["source"], len(chunk))
+            save_checkpoint(conn, progress)
+        cp.update(progress)
+        chunk.clear()
+        rate = (cp["rows"] - start_rows) / max(time.perf_counter() - started, 1e-9)
+        print(f"{cp['rows']} rows imported ({rate:,.0f} rows/s, {cp['skipped']} skipped)", file=log)
+
+    for rec, offset in iter_records(path, fmt, cp["offset"]):
+        try:
+            chunk.append(to_row(rec, default_ts))
+        except (KeyError, TypeError, ValueError):
+            cp["skipped"] += 1
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk or offset != cp["offset"]:
+        flush()  # also records trailing skipped rows
+    load_s = time.perf_counter() - started
+
+    t = time.perf_counter()
+    init_db()  # recreates the purchase indexes
+    index_s = time.perf_counter() - t
+
+    profiles = None
+    if rebuild_profiles:
+        t = time.perf_counter()
+        profiles = rebuild_user_profiles()
+        print(f"rebuilt {profiles} user profiles in {time.perf_counter() - t:.1f}s", file=log)
+
+    cp["done"] = True
+    with engine.begin() as conn:
+        save_checkpoint(conn, cp)
+    imported = cp["rows"] - start_rows
+    print(
+        f"done: {imported} rows in {load_s:.1f}s ({imported / max(load_s, 1e-9):,.0f} rows/s), "
+        f"index rebuild {index_s:.1f}s, {cp['skipped']} rows skipped",
+        file=log,
+    )
+    return cp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import purchases from CSV or JSONL")
+    parser.add_argument("path", help="CSV (with header) or JSONL export")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="default: from the file extension")
+    parser.add_argument("--chunk-size", type=int, default=50_000, help="rows per transaction")
+    parser.add_argument("--restart", action="store_true",
+                        help="delete the rows a previous run of this file imported and import it from the start")
+    parser.add_argument("--keep-indexes", action="store_true", help="don't drop purchase indexes during the load")
+    parser.add_argument("--skip-profiles", action="store_true", help="don't rebuild user profiles at the end")
+    args = parser.parse_args(argv)
+
+    bulk_import(
+        args.path,
+        fmt=args.format,
+        chunk_size=args.chunk_size,
+        restart=args.restart,
+        drop_indexes=not args.keep_indexes,
+        rebuild_profiles=not args.skip_profiles,
+    )
+
+
+if __name__ == "__main__":
+    main()
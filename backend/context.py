@@ -0,0 +1,203 @@
+# backend/context.py
+"""
+Token-budgeted prompt context.
+
+The assembler takes the retrieved docs, nearby stores and the rendered
+purchase profile and:
+
+- drops near-duplicates: stores whose normalized names match within
+  DUPLICATE_STORE_M of each other, and docs whose word shingles mostly
+  overlap (e.g. overlapping chunks of one file);
+- scores every piece: docs by retrieval rank, stores by distance, the
+  profile by how recent the last purchase was;
+- packs the best pieces into `token_budget` tokens of the target model's
+  tokenizer (section headers included) and renders them in the usual
+  "Seed docs / Nearby stores / Past purchases" layout.
+
+Token counts of snippets are cached; store lines are counted as a static
+part (name, promos) and a per-request distance part so the static part
+stays cached as the user moves.
+"""
+
+import math
+import os
+import re
+from datetime import datetime
+from typing import NamedTuple, Tuple
+
+from .cache import LRUCache
+from .db import PROFILE_HALF_LIFE_DAYS
+from .utils import haversine, normalize_name
+
+DUPLICATE_STORE_M = 150
+DUPLICATE_DOC_OVERLAP = 0.8
+_WORD_RE = re.compile(r"\w+")
+
+SECTIONS = (
+    ("docs", "Seed docs:"),
+    ("stores", "Nearby stores:"),
+    ("profile", None),  # the profile block carries its own header
+)
+
+
+class Piece(NamedTuple):
+    section: str
+    parts: Tuple[str, ...]  # rendered text = "".join(parts); counted part by part
+    score: float
+    order: int  # position within its section when rendered
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+
+# -------------------------
+# De-duplication
+# -------------------------
+def _shingles(text, n=3):
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < n:
+        return {tuple(words)}
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def dedupe_docs(retrieved, threshold=DUPLICATE_DOC_OVERLAP):
+    """Keep the first (best ranked) of docs whose shingle sets overlap by >= threshold (share of the smaller set)"""
+    kept, kept_shingles = [], []
+    for doc in retrieved:
+        sh = _shingles(doc["text"])
+        if any(len(sh & other) / max(1, min(len(sh), len(other))) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(sh)
+    return kept
+
+
+def _same_place(a, b, radius_m):
+    """Stores' own coordinates within radius_m (distances from the user only bound how far apart they are)"""
+    if None in (a.get("lat"), a.get("lng"), b.get("lat"), b.get("lng")):
+        return False
+    return haversine(float(a["lat"]), float(a["lng"]), float(b["lat"]), float(b["lng"])) <= radius_m
+
+
+def dedupe_nearby(nearest, radius_m=DUPLICATE_STORE_M):
+    """Keep the closest of stores with the same normalized name within radius_m of each other"""
+    kept = []
+    for store in sorted(nearest, key=lambda s: s.get("distance_m", 0)):
+        name = normalize_name(store.get("name"))
+        if any(normalize_name(k.get("name")) == name and _same_place(k, store, radius_m) for k in kept):
+            continue
+        kept.append(store)
+    return kept
+
+
+# -------------------------
+# Scoring
+# -------------------------
+def doc_pieces(retrieved):
+    return [
+        Piece("docs", (doc["text"] + "\n",), 1.0 / (1 + rank), rank)
+        for rank, doc in enumerate(dedupe_docs(retrieved))
+    ]
+
+
+def store_pieces(nearest):
+    pieces = []
+    for order, s in enumerate(dedupe_nearby(nearest)):
+        promos = ", ".join(p["desc"] for p in s.get("promos", []))
+        parts = (f"- {s['name']}", f" ({s['distance_m']}m away)", f" | Promos: {promos}\n")
+        pieces.append(Piece("stores", parts, 1.0 / (1 + s.get("distance_m", 0) / 500.0), order))
+    return pieces
+
+
+def profile_piece(text, last_purchase_at=None):
+    if not text:
+        return None
+    age_days = (datetime.utcnow() - last_purchase_at).total_seconds() / 86400 if last_purchase_at else 0
+    score = 0.5 * math.pow(0.5, max(age_days, 0) / PROFILE_HALF_LIFE_DAYS)
+    return Piece("profile", (text,), score, 0)
+
+
+# -------------------------
+# Assembler
+# -------------------------
+class ContextAssembler:
+    def __init__(self, token_budget=600, tokenizer_name=None, count_cache_size=8192):
+        """
+        token_budget: max context tokens (0 = unlimited)
+        tokenizer_name: HF tokenizer of the target model; without one (or if it
+        cannot be loaded) tokens are estimated as ~4 characters each
+        """
+        self.token_budget = token_budget
+        self.tokenizer_name = tokenizer_name
+        self.tokenizer = None
+        self.counts = LRUCache(count_cache_size)
+
+    def load_tokenizer(self):
+        if self.tokenizer_name and self.tokenizer is None:
+            from transformers import AutoTokenizer
+
+            try:
+                self.tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+            except (OSError, ValueError):
+                self.tokenizer_name = None  # fall back to the estimate
+        return self.tokenizer
+
+    def count_tokens(self, text):
+        n = self.counts.get(text)
+        if n is None:
+            if self.tokenizer is not None:
+                n = len(self.tokenizer.encode(text, add_special_tokens=False))
+            else:
+                n = math.ceil(len(text) / 4)
+            self.counts.put(text, n)
+        return n
+
+    def piece_tokens(self, piece):
+        return sum(self.count_tokens(part) for part in piece.parts)
+
+    def pack(self, pieces):
+        """Highest scoring pieces that fit the budget, headers included"""
+        headers = dict(SECTIONS)
+        chosen, used, opened = [], 0, set()
+        for piece in sorted(pieces, key=lambda p: -p.score):
+            cost = self.piece_tokens(piece)
+            header = headers[piece.section]
+            if piece.section not in opened and header:
+                cost += self.count_tokens(header + "\n")
+            if self.token_budget and used + cost > self.token_budget:
+                continue
+            chosen.append(piece)
+            opened.add(piece.section)
+            used += cost
+        return chosen, used
+
+    def render(self, pieces):
+        blocks = []
+        for section, header in SECTIONS:
+            section_pieces = sorted((p for p in pieces if p.section == section), key=lambda p: p.order)
+            if not section_pieces:
+                continue
+            body = "".join(p.text for p in section_pieces)
+            if section == "docs":
+                body = body.rstrip("\n")
+            blocks.append(f"{header}\n{body}" if header else body)
+        return "\n".join(blocks)
+
+    def assemble(self, retrieved=None, nearest=None, profile_text=None, last_purchase_at=None):
+        """Returns (context, tokens_used)"""
+        pieces = doc_pieces(retrieved or []) + store_pieces(nearest or [])
+        profile = profile_piece(profile_text, last_purchase_at)
+        if profile is not None:
+            pieces.append(profile)
+        chosen, used = self.pack(pieces)
+        return self.render(chosen), used
+
+
+def from_env(default_tokenizer=None):
+    """CONTEXT_TOKEN_BUDGET (0 = unlimited) and CONTEXT_TOKENIZER (HF name; "none" = estimate)"""
+    tokenizer = os.environ.get("CONTEXT_TOKENIZER", default_tokenizer or "none")
+    return ContextAssembler(
+        token_budget=int(os.environ.get("CONTEXT_TOKEN_BUDGET", "600")),
+        tokenizer_name=None if tokenizer == "none" else tokenizer,
+    )
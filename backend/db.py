@@ -3,15 +3,43 @@
 
 
 from sqlmodel import SQLModel, Field, create_engine, Session, select
-from typing import Optional, List
+from sqlalchemy import JSON, Column, Index, MetaData, event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
+from typing import Optional, List, Dict
 from datetime import datetime
+import atexit
+import logging
 import os
+import queue
+import threading
+import time
+
+from backend.cache import LRUCache
+
+logger = logging.getLogger(__name__)
 
 # -------------------------
 # Database setup
 # -------------------------
 DB_FILE = os.environ.get("DB_FILE", "backend/users.db")
-engine = create_engine(f"sqlite:///{DB_FILE}", echo=False)
+engine = create_engine(
+    f"sqlite:///{DB_FILE}",
+    echo=False,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=int(os.environ.get("DB_POOL_SIZE", "8")),
+    max_overflow=int(os.environ.get("DB_POOL_OVERFLOW", "8")),
+)
+
+
+@event.listens_for(engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")  # readers never block the writer
+    cur.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints, safe with WAL
+    cur.execute("PRAGMA busy_timeout=5000")
+    cur.close()
 
 
 # -------------------------
@@ -26,45 +54,393 @@ class User(SQLModel, table=True):
 
 
 class Purchase(SQLModel, table=True):
+    # (user_id, timestamp) serves both per-user lookups and "latest N" scans
+    __table_args__ = (Index("ix_purchase_user_id_timestamp", "user_id", "timestamp"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: str = Field(index=True)
+    user_id: str
     store_name: str
     category: str  # e.g., "Hot Cocoa"
     amount: float = 0.0
     timestamp: datetime = Field(default_factory=datetime.utcnow)
 
 
+class UserProfile(SQLModel, table=True):
+    """Per-user aggregates, updated incrementally with every committed purchase"""
+    user_id: str = Field(primary_key=True)
+    purchase_count: int = 0
+    total_spend: float = 0.0
+    recency_spend: float = 0.0  # exponentially decayed spend as of last_purchase_at
+    category_counts: Dict[str, int] = Field(default_factory=dict, sa_column=Column(JSON))
+    store_counts: Dict[str, int] = Field(default_factory=dict, sa_column=Column(JSON))
+    store_last_visit: Dict[str, str] = Field(default_factory=dict, sa_column=Column(JSON))  # store -> ISO time
+    last_purchase_at: Optional[datetime] = None
+
+
+# -------------------------
+# Profile aggregation
+# -------------------------
+PROFILE_HALF_LIFE_DAYS = float(os.environ.get("PROFILE_HALF_LIFE_DAYS", "30"))
+
+
+def _decay(value: float, since: datetime, until: datetime) -> float:
+    days = (until - since).total_seconds() / 86400.0
+    return value * 0.5 ** (max(days, 0.0) / PROFILE_HALF_LIFE_DAYS)
+
+
+def apply_purchase(profile: UserProfile, store_name: str, category: str, amount: float, timestamp: datetime):
+    """Fold one purchase into a profile (purchases should arrive in timestamp order)"""
+    if profile.last_purchase_at is not None:
+        profile.recency_spend = _decay(profile.recency_spend or 0.0, profile.last_purchase_at, timestamp)
+    profile.recency_spend = (profile.recency_spend or 0.0) + (amount or 0.0)
+    profile.purchase_count = (profile.purchase_count or 0) + 1
+    profile.total_spend = (profile.total_spend or 0.0) + (amount or 0.0)
+
+    # JSON columns only register a change when reassigned
+    categories = dict(profile.category_counts or {})
+    categories[category] = categories.get(category, 0) + 1
+    profile.category_counts = categories
+    stores = dict(profile.store_counts or {})
+    stores[store_name] = stores.get(store_name, 0) + 1
+    profile.store_counts = stores
+    visits = dict(profile.store_last_visit or {})
+    visits[store_name] = max(visits.get(store_name, ""), timestamp.isoformat())
+    profile.store_last_visit = visits
+
+    if profile.last_purchase_at is None or timestamp > profile.last_purchase_at:
+        profile.last_purchase_at = timestamp
+    return profile
+
+
+def recency_spend_now(profile: UserProfile, now: datetime = None) -> float:
+    """Recency-weighted spend decayed to `now`"""
+    if profile.last_purchase_at is None:
+        return 0.0
+    return _decay(profile.recency_spend or 0.0, profile.last_purchase_at, now or datetime.utcnow())
+
+
+# -------------------------
+# Write-behind purchase queue
+# -------------------------
+class PurchaseWriter:
+    """
+    Background writer for purchase tracking. add_purchase() only enqueues;
+    this thread commits queued rows in batched transactions of up to
+    `max_batch` rows, waiting at most `flush_interval` seconds to fill a batch.
+    Rows not yet committed stay visible through pending_for() so a user's
+    history reads its own writes.
+    """
+
+    def __init__(self, max_batch=500, flush_interval=0.05, max_queue=100_000):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = {}  # user_id -> [Purchase] not yet committed
+        self._pending_lock = threading.Lock()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self.written = 0  # rows committed
+        self.dropped = 0  # rows given up on after `retries` failed writes
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="purchase-writer", daemon=True)
+                self._thread.start()
+
+    def enqueue(self, purchase: Purchase):
+        self.start()
+        with self._pending_lock:
+            self._pending.setdefault(purchase.user_id, []).append(purchase)
+        self._queue.put(purchase)  # blocks when max_queue rows are waiting (back-pressure)
+
+    def pending_for(self, user_id: str) -> List[Purchase]:
+        with self._pending_lock:
+            return list(self._pending.get(user_id, ()))
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        return {"queued": self.qsize(), "written": self.written, "dropped": self.dropped}
+
+    def flush(self):
+        """Block until everything queued so far is committed"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def stop(self):
+        """Commit what is queued and stop the writer thread (called on shutdown)"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        self._thread = None
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            rows = [p for p in batch if p is not None]
+            if rows:
+                self._write(rows)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, rows: List[Purchase], retries=3):
+        for attempt in range(retries):
+            try:
+                # purchases and the affected profiles commit in one transaction
+                with Session(engine) as session:
+                    session.execute(Purchase.__table__.insert(), [
+                        {
+                            "user_id": p.user_id,
+                            "store_name": p.store_name,
+                            "category": p.category,
+                            "amount": p.amount,
+                            "timestamp": p.timestamp,
+                        }
+                        for p in rows
+                    ])
+                    user_ids = list({p.user_id for p in rows})
+                    profiles = {
+                        prof.user_id: prof
+                        for prof in session.exec(select(UserProfile).where(UserProfile.user_id.in_(user_ids)))
+                    }
+                    for p in sorted(rows, key=lambda p: p.timestamp):
+                        profile = profiles.get(p.user_id)
+                        if profile is None:
+                            profile = profiles[p.user_id] = UserProfile(user_id=p.user_id)
+                            session.add(profile)
+                        apply_purchase(profile, p.store_name, p.category, p.amount, p.timestamp)
+                    session.commit()
+                self.written += len(rows)
+                break
+            except Exception:
+                if attempt == retries - 1:
+                    self.dropped += len(rows)
+                    logger.exception("Dropping %d purchases after %d failed writes (%d dropped so far)",
+                                     len(rows), retries, self.dropped)
+                    break
+                time.sleep(0.1 * (attempt + 1))
+
+        done = {id(p) for p in rows}
+        with self._pending_lock:
+            for user_id in {p.user_id for p in rows}:
+                left = [p for p in self._pending.get(user_id, ()) if id(p) not in done]
+                if left:
+                    self._pending[user_id] = left
+                else:
+                    self._pending.pop(user_id, None)
+
+
+purchase_writer = PurchaseWriter(
+    max_batch=int(os.environ.get("PURCHASE_BATCH", "500")),
+    flush_interval=float(os.environ.get("PURCHASE_FLUSH_MS", "50")) / 1000.0,
+)
+atexit.register(purchase_writer.stop)
+
+# Users seen by this process; known users cost no DB round trip
+_user_cache = LRUCache(maxsize=int(os.environ.get("USER_CACHE_SIZE", "100000")))
+
+IN_CHUNK = 500  # ids per IN (...) query, under SQLite's bound-parameter limit
+
+
 # -------------------------
 # DB Helper functions
 # -------------------------
 def init_db():
     """Create DB tables if not exist"""
     SQLModel.metadata.create_all(engine)
+    # create_all skips tables that already exist, so add new indexes explicitly
+    for index in Purchase.__table__.indexes:
+        index.create(engine, checkfirst=True)
 
 
 def create_user(user_id: str, first_name: str = None, last_name: str = None) -> User:
+    """Get or create; served from the in-memory cache for users already seen"""
+    user = _user_cache.get(user_id)
+    if user is not None:
+        return user
     with Session(engine) as session:
         user = session.exec(select(User).where(User.user_id == user_id)).first()
-        if user:
-            return user
-        user = User(user_id=user_id, first_name=first_name, last_name=last_name)
-        session.add(user)
-        session.commit()
-        session.refresh(user)
+        if not user:
+            user = User(user_id=user_id, first_name=first_name, last_name=last_name)
+            session.add(user)
+            session.commit()
+            session.refresh(user)
+        _user_cache.put(user_id, user)
         return user
 
 
+def create_users(user_ids: List[str]) -> Dict[str, User]:
+    """
+    create_user() for many ids: users not in the cache are looked up with one
+    IN query per IN_CHUNK ids and the missing ones inserted in one transaction
+    """
+    users = {}
+    missing = []
+    for user_id in dict.fromkeys(user_ids):
+        user = _user_cache.get(user_id)
+        if user is not None:
+            users[user_id] = user
+        else:
+            missing.append(user_id)
+    if not missing:
+        return users
+    with Session(engine, expire_on_commit=False) as session:  # new rows keep their loaded fields, no refresh
+        for start in range(0, len(missing), IN_CHUNK):
+            chunk = missing[start:start + IN_CHUNK]
+            users.update((u.user_id, u) for u in session.exec(select(User).where(User.user_id.in_(chunk))))
+        new = [User(user_id=user_id) for user_id in missing if user_id not in users]
+        if new:
+            session.add_all(new)
+            try:
+                session.commit()
+            except IntegrityError:  # another request created some of them meanwhile
+                session.rollback()
+                new = [create_user(u.user_id) for u in new]
+            users.update((u.user_id, u) for u in new)
+    for user_id in missing:
+        _user_cache.put(user_id, users[user_id])
+    return users
+
+
 def add_purchase(user_id: str, store_name: str, category: str, amount: float = 0.0) -> Purchase:
-    with Session(engine) as session:
-        purchase = Purchase(user_id=user_id, store_name=store_name, category=category, amount=amount)
-        session.add(purchase)
-        session.commit()
-        session.refresh(purchase)
-        return purchase
+    """Queue a purchase for the background writer (id is assigned when it is committed)"""
+    purchase = Purchase(user_id=user_id, store_name=store_name, category=category, amount=amount)
+    purchase_writer.enqueue(purchase)
+    return purchase
 
 
 def get_purchases_for_user(user_id: str, limit: int = 5) -> List[Purchase]:
+    pending = purchase_writer.pending_for(user_id)
     with Session(engine) as session:
         stmt = select(Purchase).where(Purchase.user_id == user_id).order_by(Purchase.timestamp.desc()).limit(limit)
         results = session.exec(stmt).all()
-        return results
+    if pending:
+        # a row committed between the two reads shows up in both lists
+        seen = {(p.timestamp, p.store_name, p.category) for p in results}
+        extra = [p for p in pending if (p.timestamp, p.store_name, p.category) not in seen]
+        results = sorted(list(results) + extra, key=lambda p: p.timestamp, reverse=True)[:limit]
+    return results
+
+
+def get_user_profile(user_id: str) -> Optional[UserProfile]:
+    """
+    One-row read of the user's aggregates, including purchases that are
+    still queued for the writer. Returns None for users with no purchases.
+    """
+    pending = purchase_writer.pending_for(user_id)
+    with Session(engine) as session:
+        profile = session.get(UserProfile, user_id)
+        if profile is not None:
+            session.expunge(profile)
+    return _with_pending(profile, user_id, pending)
+
+
+def get_user_profiles(user_ids: List[str]) -> Dict[str, Optional[UserProfile]]:
+    """get_user_profile() for many users with one IN query per IN_CHUNK ids"""
+    user_ids = list(dict.fromkeys(user_ids))
+    pending = {user_id: purchase_writer.pending_for(user_id) for user_id in user_ids}
+    profiles = dict.fromkeys(user_ids)
+    with Session(engine) as session:
+        for start in range(0, len(user_ids), IN_CHUNK):
+            chunk = user_ids[start:start + IN_CHUNK]
+            for profile in session.exec(select(UserProfile).where(UserProfile.user_id.in_(chunk))):
+                session.expunge(profile)
+                profiles[profile.user_id] = profile
+    return {user_id: _with_pending(profile, user_id, pending[user_id]) for user_id, profile in profiles.items()}
+
+
+def _with_pending(profile: Optional[UserProfile], user_id: str, pending: List[Purchase]) -> Optional[UserProfile]:
+    if pending:
+        # work on a copy so the pending rows are not folded in twice
+        profile = UserProfile(**profile.dict()) if profile is not None else UserProfile(user_id=user_id)
+        for p in sorted(pending, key=lambda p: p.timestamp):
+            if profile.last_purchase_at is None or p.timestamp > profile.last_purchase_at:
+                apply_purchase(profile, p.store_name, p.category, p.amount, p.timestamp)
+    return profile
+
+
+def rebuild_user_profiles(batch_users: int = 1000) -> int:
+    """
+    Recompute every UserProfile from the purchase table (after bulk loads or
+    on databases created before profiles existed). Profiles are built into a
+    staging table from the purchases committed so far, streamed in (user_id,
+    timestamp) order so memory stays flat, while readers and the purchase
+    writer keep using the live table. One transaction then folds in the
+    purchases committed meanwhile and swaps the staging table in. Returns the
+    number of profiles written.
+    """
+    staging = UserProfile.__table__.to_metadata(MetaData(), name=f"{UserProfile.__tablename__}_rebuild")
+    staging.drop(engine, checkfirst=True)
+    staging.create(engine)
+    with engine.connect() as conn:
+        last_id = conn.execute(select(func.max(Purchase.id))).scalar() or 0
+
+    written = 0
+    batch = []
+
+    def flush():
+        with engine.begin() as conn:
+            conn.execute(staging.insert(), [profile.dict() for profile in batch])
+        batch.clear()
+
+    with engine.connect() as read_conn:
+        rows = read_conn.execution_options(stream_results=True).execute(
+            select(Purchase.user_id, Purchase.store_name, Purchase.category, Purchase.amount, Purchase.timestamp)
+            .where(Purchase.id <= last_id)
+            .order_by(Purchase.user_id, Purchase.timestamp)
+        )
+        profile = None
+        for user_id, store_name, category, amount, timestamp in rows:
+            if profile is None or profile.user_id != user_id:
+                if profile is not None:
+                    batch.append(profile)
+                    written += 1
+                    if len(batch) >= batch_users:
+                        flush()
+                profile = UserProfile(user_id=user_id)
+            apply_purchase(profile, store_name, category, amount, timestamp)
+        if profile is not None:
+            batch.append(profile)
+            written += 1
+    if batch:
+        flush()
+
+    with engine.begin() as conn:
+        # a no-op write takes the write lock first: no purchase can commit between the catch-up and the swap
+        conn.execute(UserProfile.__table__.delete().where(False))
+        late = conn.execute(
+            select(Purchase.user_id, Purchase.store_name, Purchase.category, Purchase.amount, Purchase.timestamp)
+            .where(Purchase.id > last_id)
+            .order_by(Purchase.timestamp)
+        ).all()
+        if late:
+            user_ids = list({row.user_id for row in late})
+            profiles = {user_id: UserProfile(user_id=user_id) for user_id in user_ids}
+            for row in conn.execute(select(staging).where(staging.c.user_id.in_(user_ids))).mappings():
+                profiles[row["user_id"]] = UserProfile(**row)
+            written += sum(1 for p in profiles.values() if not p.purchase_count)
+            for user_id, store_name, category, amount, timestamp in late:
+                apply_purchase(profiles[user_id], store_name, category, amount, timestamp)
+            conn.execute(staging.delete().where(staging.c.user_id.in_(user_ids)))
+            conn.execute(staging.insert(), [p.dict() for p in profiles.values()])
+        conn.exec_driver_sql(f"DROP TABLE {UserProfile.__tablename__}")
+        conn.exec_driver_sql(f"ALTER TABLE {staging.name} RENAME TO {UserProfile.__tablename__}")
+    return written
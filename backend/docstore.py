@@ -0,0 +1,302 @@
+# backend/docstore.py
+"""
+SQLite-backed document metadata for RAGIndex.
+
+Replaces the indent=2 meta.json that had to be parsed in full on every
+start-up: rows are keyed by the FAISS int id, so retrieve() only reads the
+k rows it returns and several workers can share the file through the page
+cache.
+
+Doc texts are also indexed in an FTS5 table (external content over `docs`,
+kept in step by triggers inside the same transactions) for BM25 lexical
+search. Builds of SQLite without FTS5 simply have no lexical search.
+
+Rows written since the FAISS index was last saved are listed in `unsaved`
+(cleared by mark_saved), so a writer that died before saving can be
+recovered from (RAGIndex.recover).
+
+meta["store_id"] and meta["doc_type"] are copied into indexed columns so
+filtered retrieval can list the matching int ids without parsing JSON.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    int_id INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL UNIQUE,
+    text   TEXT NOT NULL,
+    meta   TEXT,
+    hash   TEXT,
+    store_id TEXT,
+    doc_type TEXT
+);
+CREATE TABLE IF NOT EXISTS info (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS unsaved (
+    int_id INTEGER PRIMARY KEY
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(text, content='docs', content_rowid='int_id');
+CREATE TRIGGER IF NOT EXISTS docs_fts_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts(rowid, text) VALUES (new.int_id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_fts_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, text) VALUES ('delete', old.int_id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_fts_au AFTER UPDATE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, text) VALUES ('delete', old.int_id, old.text);
+    INSERT INTO docs_fts(rowid, text) VALUES (new.int_id, new.text);
+END;
+"""
+
+FILTER_COLUMNS = ("store_id", "doc_type")
+
+_TERM_RE = re.compile(r"\w+")
+
+
+def fts_terms(text):
+    """Query terms as FTS5 string literals (quoted, so operators in user text are inert)"""
+    return ['"%s"' % t for t in _TERM_RE.findall(text.lower())]
+
+
+class DocStore:
+    """
+    Doc rows: int_id (FAISS id), doc_id (the doc's own "id"), text, meta (JSON), hash.
+    Each thread gets its own connection; writes are serialized by a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.RLock()  # re-entered when a write opens the first connection
+        self.has_fts = None  # known after the first connection
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # INSERT OR REPLACE only fires the FTS delete trigger with recursive triggers on
+            conn.execute("PRAGMA recursive_triggers=ON")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._init_filter_columns(conn)
+            self._init_fts(conn)
+        return conn
+
+    def _init_filter_columns(self, conn):
+        with self._write_lock, conn:
+            have = {row[1] for row in conn.execute("PRAGMA table_info(docs)")}
+            for col in FILTER_COLUMNS:
+                if col not in have:
+                    # docs written by older versions: backfill from the meta JSON
+                    conn.execute(f"ALTER TABLE docs ADD COLUMN {col} TEXT")
+                    conn.execute(f"UPDATE docs SET {col} = json_extract(meta, '$.{col}') WHERE meta IS NOT NULL")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS ix_docs_{col} ON docs ({col})")
+
+    def _init_fts(self, conn):
+        with self._write_lock:
+            existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'docs_fts'").fetchone()
+            try:
+                with conn:
+                    conn.executescript(FTS_SCHEMA)
+                    if not existed:
+                        # docs written before the FTS table existed
+                        conn.execute("INSERT INTO docs_fts(docs_fts) VALUES ('rebuild')")
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                self.has_fts = False
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # -------------------------
+    # Reads
+    # -------------------------
+    @staticmethod
+    def _row_to_doc(row):
+        _, doc_id, text, meta, h = row
+        return {"id": doc_id, "text": text, "meta": json.loads(meta) if meta else {}, "hash": h}
+
+    def get_many(self, int_ids):
+        """Return {int_id: doc} for the given ids (missing ids are skipped)"""
+        int_ids = [int(i) for i in int_ids]
+        if not int_ids:
+            return {}
+        marks = ",".join("?" * len(int_ids))
+        rows = self.conn.execute(
+            f"SELECT int_id, doc_id, text, meta, hash FROM docs WHERE int_id IN ({marks})", int_ids
+        ).fetchall()
+        return {row[0]: self._row_to_doc(row) for row in rows}
+
+    def int_id(self, doc_id):
+        row = self.conn.execute("SELECT int_id FROM docs WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row[0] if row else None
+
+    def int_ids(self, doc_ids):
+        """Return {doc_id: int_id} for the doc ids that are stored"""
+        out = {}
+        doc_ids = list(doc_ids)
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            out.update(self.conn.execute(
+                f"SELECT doc_id, int_id FROM docs WHERE doc_id IN ({marks})", chunk
+            ).fetchall())
+        return out
+
+    def fingerprints(self):
+        """Yield (doc_id, int_id, hash, meta) for every doc, without loading the texts"""
+        for doc_id, int_id, h, meta in self.conn.execute("SELECT doc_id, int_id, hash, meta FROM docs"):
+            yield doc_id, int_id, h, json.loads(meta) if meta else {}
+
+    @staticmethod
+    def _filter_sql(filters):
+        """SQL condition over docs for a filters dict (see filter_ids)"""
+        clauses, params = [], []
+        for col, key in (("store_id", "store_ids"), ("doc_type", "doc_types")):
+            values = filters.get(key)
+            if values is None:
+                continue
+            values = [str(v) for v in values]
+            cond = f"{col} IN ({','.join('?' * len(values))})" if values else "0"
+            if filters.get("include_unscoped", True):
+                cond = f"({cond} OR {col} IS NULL)"
+            clauses.append(cond)
+            params.extend(values)
+        return " AND ".join(clauses) or "1", params
+
+    def filter_ids(self, filters):
+        """
+        int ids of docs matching filters:
+            store_ids / doc_types: allowed values (None = no constraint)
+            include_unscoped: also keep docs with no store_id / doc_type (default True)
+        """
+        where, params = self._filter_sql(filters)
+        return [row[0] for row in self.conn.execute(f"SELECT int_id FROM docs WHERE {where}", params)]
+
+    def search_text(self, query, k=10, require=(), filters=None):
+        """
+        BM25 lexical search: [(int_id, score)], best first (higher is better).
+        Docs match any query term; with `require`, they must also contain
+        every one of those terms. `filters` restricts docs as in filter_ids.
+        """
+        conn = self.conn  # the first connection finds out whether FTS5 is available
+        if not self.has_fts:
+            return []
+        terms = fts_terms(query)
+        if not terms:
+            return []
+        expr = " OR ".join(terms)
+        required = [t for r in require for t in fts_terms(r)]
+        if required:
+            expr = "(%s) AND (%s)" % (" AND ".join(required), expr)
+        sql = "SELECT docs_fts.rowid, bm25(docs_fts) FROM docs_fts WHERE docs_fts MATCH ?"
+        params = [expr]
+        if filters:
+            # CROSS JOIN keeps the FTS match as the outer loop; `rowid IN (...)`
+            # made SQLite run the MATCH once per allowed id
+            where, filter_params = self._filter_sql(filters)
+            sql = ("SELECT docs_fts.rowid, bm25(docs_fts) FROM docs_fts CROSS JOIN docs ON docs.int_id = docs_fts.rowid "
+                   f"WHERE docs_fts MATCH ? AND {where}")
+            params.extend(filter_params)
+        rows = conn.execute(sql + " ORDER BY bm25(docs_fts) LIMIT ?", params + [int(k)]).fetchall()
+        return [(int_id, -score) for int_id, score in rows]
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def all_int_ids(self):
+        return [row[0] for row in self.conn.execute("SELECT int_id FROM docs")]
+
+    def unsaved_ids(self):
+        return [row[0] for row in self.conn.execute("SELECT int_id FROM unsaved")]
+
+    @property
+    def next_id(self):
+        row = self.conn.execute("SELECT value FROM info WHERE key = 'next_id'").fetchone()
+        return int(row[0]) if row else 0
+
+    # -------------------------
+    # Writes (each call is one transaction)
+    # -------------------------
+    def assign_ids(self, doc_ids, fresh=False):
+        """
+        Return int ids for doc_ids, allocating new ones for unseen docs (not yet committed).
+        fresh=True allocates new ids for stored docs too (their old rows go on put_many).
+        """
+        existing = {} if fresh else self.int_ids(doc_ids)
+        next_id = self.next_id
+        out = []
+        for doc_id in doc_ids:
+            if doc_id not in existing:
+                existing[doc_id] = next_id
+                next_id += 1
+            out.append(existing[doc_id])
+        return out, next_id
+
+    def put_many(self, rows, next_id):
+        """rows: iterable of (int_id, doc); also persists the id counter and marks the rows unsaved"""
+        rows = [self._row(int_id, d) for int_id, d in rows]
+        with self._write_lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO docs (int_id, doc_id, text, meta, hash, store_id, doc_type)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.executemany("INSERT OR IGNORE INTO unsaved (int_id) VALUES (?)", [(row[0],) for row in rows])
+            self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('next_id', ?)", (str(next_id),))
+
+    @staticmethod
+    def _row(int_id, d):
+        meta = d.get("meta") or {}
+        scoped = [meta.get(col) for col in FILTER_COLUMNS]
+        return (
+            int_id, d["id"], d["text"], json.dumps(meta, ensure_ascii=False), d.get("hash"),
+            *(str(v) if v is not None else None for v in scoped),
+        )
+
+    def delete_many(self, int_ids):
+        params = [(int(i),) for i in int_ids]
+        with self._write_lock, self.conn:
+            self.conn.executemany("DELETE FROM docs WHERE int_id = ?", params)
+            self.conn.executemany("DELETE FROM unsaved WHERE int_id = ?", params)
+
+    def mark_saved(self):
+        """The index now holds every row written so far"""
+        with self._write_lock, self.conn:
+            self.conn.execute("DELETE FROM unsaved")
+
+    def clear(self):
+        with self._write_lock, self.conn:
+            self.conn.execute("DELETE FROM docs")
+            self.conn.execute("DELETE FROM info")
+            self.conn.execute("DELETE FROM unsaved")
+
+    def import_json(self, path):
+        """Migrate a meta.json written by older versions of RAGIndex.save()"""
+        with open(path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if isinstance(meta, list):
+            # positional layout over a plain IndexFlatIP
+            docs, next_id = dict(enumerate(meta)), len(meta)
+        else:
+            docs, next_id = {int(i): d for i, d in meta["docs"].items()}, meta["next_id"]
+        self.put_many(docs.items(), next_id)
+        self.mark_saved()  # the index these docs came with is already on disk
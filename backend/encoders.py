@@ -0,0 +1,127 @@
+# backend/encoders.py
+"""
+Pluggable sentence encoders for RAGIndex.
+
+    torch  SentenceTransformer on PyTorch, fp32 (the reference)
+    int8   the same model with its Linear layers dynamically quantized to int8
+    onnx   sentence-transformers' ONNX Runtime backend (fp32 export; needs
+           sentence-transformers >= 3.2 with optimum[onnxruntime], both in
+           requirements.txt)
+
+Every encoder belongs to a *vector space*, "<model>@<precision>". torch and
+onnx produce the same fp32 vectors (up to float rounding) and share a space;
+int8 vectors drift enough to move neighbours, so they get their own. An
+index records the space it was built in and RAGIndex.load() refuses to serve
+it with an encoder from another space.
+"""
+
+import importlib.util
+import threading
+
+import faiss
+import numpy as np
+
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EncoderMismatchError(ValueError):
+    """Raised when an index was built by an encoder from a different vector space"""
+
+
+class Encoder:
+    backend = None
+    precision = "fp32"
+
+    def __init__(self, model_name=DEFAULT_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def vector_space(self):
+        return f"{self.model_name}@{self.precision}"
+
+    def spec(self):
+        """What gets recorded next to an index"""
+        return {"backend": self.backend, "model": self.model_name, "vector_space": self.vector_space}
+
+    @property
+    def model(self):
+        """The underlying SentenceTransformer, loaded on first use"""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    @property
+    def tokenizer(self):
+        return getattr(self.model, "tokenizer", None)
+
+    def _load(self):
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(self.model_name)
+
+    def encode(self, texts, batch_size=32, pool=None):
+        """L2-normalized float32 (n, d) embeddings; pool: a sentence-transformers multi-process pool"""
+        if pool is not None:
+            embs = self.model.encode_multi_process(texts, pool, batch_size=batch_size)
+        else:
+            embs = self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+        embs = np.ascontiguousarray(embs, dtype="float32")
+        faiss.normalize_L2(embs)
+        return embs
+
+
+class TorchEncoder(Encoder):
+    backend = "torch"
+
+
+class Int8Encoder(Encoder):
+    backend = "int8"
+    precision = "int8"
+
+    def _load(self):
+        import torch
+
+        model = super()._load()
+        model.eval()
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxEncoder(Encoder):
+    backend = "onnx"
+
+    def _load(self):
+        import sentence_transformers
+        from sentence_transformers import SentenceTransformer
+
+        version = tuple(int(p) for p in sentence_transformers.__version__.split(".")[:2] if p.isdigit())
+        if version < (3, 2) or not all(importlib.util.find_spec(mod) for mod in ("onnxruntime", "optimum")):
+            raise RuntimeError(
+                "The onnx encoder needs sentence-transformers>=3.2 and optimum[onnxruntime] "
+                f"(found sentence-transformers {sentence_transformers.__version__}): pip install -r requirements.txt"
+            )
+        return SentenceTransformer(self.model_name, backend="onnx")
+
+
+ENCODERS = {cls.backend: cls for cls in (TorchEncoder, Int8Encoder, OnnxEncoder)}
+ENCODER_BACKENDS = tuple(ENCODERS)
+
+
+def get_encoder(backend="torch", model_name=DEFAULT_MODEL) -> Encoder:
+    try:
+        return ENCODERS[backend](model_name)
+    except KeyError:
+        raise ValueError(f"Unknown encoder {backend!r}, expected one of {ENCODER_BACKENDS}") from None
+
+
+def check_compatible(recorded: dict, encoder: Encoder):
+    """Raise EncoderMismatchError unless encoder produces vectors in the space an index recorded"""
+    if recorded.get("vector_space") != encoder.vector_space:
+        raise EncoderMismatchError(
+            f"Index was built with {recorded.get('backend')} encoder ({recorded.get('vector_space')}); "
+            f"{encoder.backend} encoder produces {encoder.vector_space}. Rebuild the index "
+            f"(python -m backend.index_build --full) or switch encoders."
+        )
@@ -2,18 +2,21 @@
 generator.py
 Local LLM generator wrapper for the chatbot. No cloud API calls.
 Pairs with pii_masker to ensure sensitive information is never sent raw.
+
+The model is loaded lazily (or in the background via start_background_load)
+instead of at import time. Non-streaming requests go through a scheduler
+thread that dynamically batches concurrent prompts: left padding, left
+truncation of long prompts, a capped queue and a per-request max-token limit.
+Streams run one generate thread each, capped at max_streams at a time.
 """
 
-from transformers import pipeline
-from .pii_masker import mask_pii
+import os
+import queue
+import time
+from concurrent.futures import Future
+from threading import Event, Lock, Thread
 
-# FREE offline model — can later be switched to Mistral, LLaMA, Falcon, etc.
-generator = pipeline(
-    "text-generation",
-    model="gpt2",
-    max_new_tokens=200,
-    pad_token_id=50256
-)
+from .pii_masker import mask_pii
 
 SYSTEM_PROMPT = (
     "You are a smart retail assistant. You only answer using the given context. "
@@ -21,24 +24,287 @@ SYSTEM_PROMPT = (
 )
 
 
-def generate_response(user_message: str, context: str) -> str:
+class QueueFullError(RuntimeError):
+    """Raised when the generation queue is at max_queue and cannot take more prompts"""
+
+
+class LocalGenerator:
     """
-    Generates a response using a local model.
-    PII is masked before constructing the prompt.
+    Batched local text generation.
+
+    dtype: "fp32" or "bf16" (reduced-precision CPU mode)
+    num_threads: torch intra-op threads (None = torch default)
+    max_batch / max_wait_ms: a batch is flushed when it is full or when the
+    oldest prompt has waited max_wait_ms
+    max_queue: prompts waiting beyond this are rejected with QueueFullError
+    max_streams: streams running beyond this are rejected with QueueFullError
+    max_input_tokens: prompts are truncated from the left to fit
     """
-    masked_message = mask_pii(user_message)
 
-    prompt = (
+    # FREE offline model — can later be switched to Mistral, LLaMA, Falcon, etc.
+    def __init__(self, model_name="gpt2", dtype="fp32", num_threads=None, max_batch=8,
+                 max_wait_ms=10.0, max_queue=64, max_streams=4, max_new_tokens=200, max_input_tokens=768):
+        self.model_name = model_name
+        self.dtype = dtype
+        self.num_threads = num_threads
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.max_streams = max_streams
+        self.max_new_tokens = max_new_tokens
+        self.max_input_tokens = max_input_tokens
+
+        self.model = None
+        self.tokenizer = None
+        self.ready = Event()
+        self.load_error = None
+        self._load_lock = Lock()
+        self._worker_lock = Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._stream_lock = Lock()
+        self.active_streams = 0
+        self.stats = {"batches": 0, "requests": 0, "generated_tokens": 0, "rejected": 0}
+
+    # -------------------------
+    # Loading
+    # -------------------------
+    def load(self):
+        """Load tokenizer + model once; safe to call from several threads"""
+        if self.ready.is_set():
+            return
+        with self._load_lock:
+            if self.ready.is_set():
+                return
+            import torch
+            from transformers import AutoModelForCausalLM, AutoTokenizer
+
+            try:
+                if self.num_threads:
+                    torch.set_num_threads(self.num_threads)
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                tokenizer.padding_side = "left"  # decoder-only: new tokens must follow the prompt
+                tokenizer.truncation_side = "left"  # keep the end of the prompt ("Assistant:")
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+
+                torch_dtype = torch.bfloat16 if self.dtype == "bf16" else torch.float32
+                model = AutoModelForCausalLM.from_pretrained(self.model_name, torch_dtype=torch_dtype)
+                model.eval()
+            except Exception as e:
+                self.load_error = e
+                raise
+
+            self.tokenizer, self.model = tokenizer, model
+            self.ready.set()
+
+    def start_background_load(self):
+        """Load the model in a daemon thread; errors are kept in load_error"""
+        def _load():
+            try:
+                self.load()
+            except Exception:
+                pass
+        Thread(target=_load, name="generator-load", daemon=True).start()
+
+    # -------------------------
+    # Scheduling
+    # -------------------------
+    def submit(self, prompt: str, max_new_tokens: int = None) -> Future:
+        """Queue a prompt; the Future resolves to the generated continuation"""
+        if self._queue.qsize() >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise QueueFullError(f"generation queue is full ({self.max_queue} waiting)")
+        self._ensure_worker()
+        fut = Future()
+        limit = min(max_new_tokens or self.max_new_tokens, self.max_new_tokens)
+        self._queue.put((prompt, limit, fut))
+        return fut
+
+    def check_stream_slot(self):
+        """Raise QueueFullError when max_streams streams are already running"""
+        if self.active_streams >= self.max_streams:
+            self.stats["rejected"] += 1
+            raise QueueFullError(f"too many streams ({self.max_streams} running)")
+
+    def _open_stream(self):
+        with self._stream_lock:
+            self.check_stream_slot()
+            self.active_streams += 1
+
+    def _close_stream(self):
+        with self._stream_lock:
+            self.active_streams -= 1
+
+    def generate(self, prompt: str, max_new_tokens: int = None, timeout: float = None) -> str:
+        return self.submit(prompt, max_new_tokens).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            with self._worker_lock:
+                if self._worker is None or not self._worker.is_alive():
+                    self._worker = Thread(target=self._run, name="generator-batcher", daemon=True)
+                    self._worker.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [item for item in self._collect() if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                self.load()
+                outputs = self._generate_batch([p for p, _, _ in batch], [n for _, n, _ in batch])
+            except Exception as e:
+                for _, _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, _, fut), text in zip(batch, outputs):
+                fut.set_result(text)
+
+    def _generate_batch(self, prompts, limits):
+        import torch
+
+        enc = self.tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            truncation=True,
+            max_length=self.max_input_tokens,
+        )
+        with torch.inference_mode():
+            out = self.model.generate(
+                **enc,
+                max_new_tokens=max(limits),
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+
+        prompt_len = enc["input_ids"].shape[1]
+        eos = self.tokenizer.eos_token_id
+        texts = []
+        for row, limit in zip(out, limits):
+            new_tokens = row[prompt_len:prompt_len + limit].tolist()
+            if eos in new_tokens:
+                new_tokens = new_tokens[:new_tokens.index(eos)]
+            self.stats["generated_tokens"] += len(new_tokens)
+            texts.append(self.tokenizer.decode(new_tokens, skip_special_tokens=True))
+        self.stats["batches"] += 1
+        self.stats["requests"] += len(prompts)
+        return texts
+
+
+_generator = None
+_generator_lock = Lock()
+
+
+def get_generator() -> LocalGenerator:
+    """Process-wide generator configured from LOCAL_LLM_* env vars (model loads lazily)"""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                threads = os.environ.get("LOCAL_LLM_THREADS")
+                _generator = LocalGenerator(
+                    model_name=os.environ.get("LOCAL_LLM_MODEL", "gpt2"),
+                    dtype=os.environ.get("LOCAL_LLM_DTYPE", "fp32"),
+                    num_threads=int(threads) if threads else None,
+                    max_batch=int(os.environ.get("LOCAL_LLM_MAX_BATCH", "8")),
+                    max_wait_ms=float(os.environ.get("LOCAL_LLM_MAX_WAIT_MS", "10")),
+                    max_queue=int(os.environ.get("LOCAL_LLM_MAX_QUEUE", "64")),
+                    max_streams=int(os.environ.get("LOCAL_LLM_MAX_STREAMS", "4")),
+                    max_new_tokens=int(os.environ.get("LOCAL_LLM_MAX_NEW_TOKENS", "200")),
+                )
+    return _generator
+
+
+def build_prompt(user_message: str, context: str) -> str:
+    """PII is masked before constructing the prompt."""
+    masked_message = mask_pii(user_message)
+    return (
         f"{SYSTEM_PROMPT}\n\n"
         f"Context: {context}\n"
         f"User: {masked_message}\n"
         f"Assistant:"
     )
 
-    output = generator(prompt)[0]["generated_text"]
 
-    # Return only the assistant reply portion
-    if "Assistant:" in output:
-        return output.split("Assistant:")[-1].strip()
+def submit_response(user_message: str, context: str, max_new_tokens: int = None) -> Future:
+    """Queue a reply for batched generation; the Future resolves to the raw continuation"""
+    return get_generator().submit(build_prompt(user_message, context), max_new_tokens)
 
+
+def clean_reply(output: str) -> str:
+    """Only the continuation is decoded, but the model may go on to invent another turn"""
+    if "User:" in output:
+        output = output.split("User:")[0]
     return output.strip()
+
+
+def generate_response(user_message: str, context: str) -> str:
+    """
+    Generates a response using a local model.
+    PII is masked before constructing the prompt.
+    """
+    return clean_reply(submit_response(user_message, context).result())
+
+
+def stream_response(user_message: str, context: str, stop_event: Event = None):
+    """
+    Yields reply text pieces as the local model produces them.
+    Setting `stop_event` (e.g. on client disconnect) ends generation early.
+    Streams are per-request (batch of one) and bypass the batching scheduler;
+    at most max_streams run at once, further ones raise QueueFullError.
+    """
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    class StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return stop_event.is_set()
+
+    stop_event = stop_event or Event()
+    gen = get_generator()
+    gen._open_stream()
+    try:
+        gen.load()
+        tokenizer = gen.tokenizer
+
+        inputs = tokenizer(
+            build_prompt(user_message, context),
+            return_tensors="pt",
+            truncation=True,
+            max_length=gen.max_input_tokens,
+        )
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+        thread = Thread(
+            target=gen.model.generate,
+            kwargs=dict(
+                **inputs,
+                streamer=streamer,
+                max_new_tokens=gen.max_new_tokens,
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([StopOnEvent()]),
+            ),
+            daemon=True,
+        )
+        thread.start()
+        try:
+            for text in streamer:
+                if text:
+                    yield text
+        finally:
+            stop_event.set()
+            thread.join()  # the slot is free once generation has actually stopped
+    finally:
+        gen._close_stream()
@@ -1,12 +1,50 @@
 # backend/index_build.py
-from .rag import RAGIndex, load_seed_docs
+import argparse
+import os
 
+from .encoders import ENCODER_BACKENDS
+from .ingest import ingest
+from .rag import INDEX_KINDS, RAGIndex
 
-def main():
-    docs = load_seed_docs('data/seed_docs')
-    rag = RAGIndex()
-    rag.build_from_docs(docs)
-    print('Index built with', len(docs), 'docs')
+BASE_DIR = os.path.dirname(__file__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or incrementally update the RAG index")
+    parser.add_argument("--docs", default="data/seed_docs", help="directory of seed docs (searched recursively)")
+    parser.add_argument("--ext", default=".txt,.md", help="comma-separated file extensions to ingest")
+    parser.add_argument("--full", action="store_true", help="re-embed every chunk instead of only new/changed ones")
+    parser.add_argument("--index-kind", default="auto", choices=("auto",) + INDEX_KINDS,
+                        help="FAISS index type used for a full build")
+    parser.add_argument("--encoder", default=os.environ.get("RAG_ENCODER", "torch"), choices=ENCODER_BACKENDS,
+                        help="embedding backend; must match the one the server uses (RAG_ENCODER)")
+    parser.add_argument("--chunk-tokens", type=int, default=200, help="tokens per chunk")
+    parser.add_argument("--overlap", type=int, default=40, help="tokens shared by consecutive chunks")
+    parser.add_argument("--batch-size", type=int, default=64, help="encode batch size")
+    parser.add_argument("--flush-every", type=int, default=20_000, help="chunks embedded and indexed per flush")
+    parser.add_argument("--workers", type=int, default=1, help="encode processes (>1 starts a multi-process pool)")
+    args = parser.parse_args(argv)
+
+    rag = RAGIndex(
+        index_path=os.path.join(BASE_DIR, "faiss_index.index"),
+        meta_path=os.path.join(BASE_DIR, "meta.db"),
+        index_kind=args.index_kind,
+        encoder=args.encoder,
+    )
+    full = args.full or not rag.load()
+
+    stats = ingest(
+        rag,
+        args.docs,
+        full=full,
+        extensions=tuple(e.strip() for e in args.ext.split(",") if e.strip()),
+        chunk_tokens=args.chunk_tokens,
+        overlap=args.overlap,
+        batch_size=args.batch_size,
+        flush_every=args.flush_every,
+        workers=args.workers,
+    )
+    print('Index built' if full else 'Index updated', '-', ', '.join(f"{k}={v}" for k, v in stats.items()))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,154 @@
+# backend/ingest.py
+"""
+Streaming ingestion: files → token-aware chunks → batched embeddings → index.
+
+    discover_files   recursive walk, sorted, filtered by extension
+    chunk_text       windows of `chunk_tokens` tokens overlapping by `overlap`,
+                     cut on the embedding model's own tokenizer (character
+                     offsets come from its offset mapping)
+    ingest           embeds pending chunks every `flush_every` chunks and
+                     upserts them, so memory is bounded by one flush whatever
+                     the corpus size; with workers > 1 encoding is spread over
+                     a sentence-transformers multi-process pool
+
+Chunk ids are "<relative path>#<n>" and their meta records the source file
+and the [start, end) character offsets of the chunk within it. A sidecar
+"<file>.meta.json" object (e.g. {"store_id": "store_001", "doc_type":
+"promo"}) is merged into the meta of every chunk of that file, which is
+what retrieval filters match on. Unchanged chunks (same id, text hash and
+meta) are not re-embedded, and chunks of files that disappeared or shrank
+are deleted. The index is only saved at the end, so an incremental run
+first recovers from one that died before saving (RAGIndex.recover).
+"""
+
+import json
+import os
+import re
+import time
+
+from .rag import RAGIndex, choose_index_kind, content_hash
+
+DEFAULT_EXTENSIONS = (".txt", ".md")
+_WORD_RE = re.compile(r"\S+")
+# rough chars per token, only used to size the index before the first flush
+_CHARS_PER_TOKEN = 4
+
+
+def discover_files(root, extensions=DEFAULT_EXTENSIONS):
+    """Yield paths under root with a matching extension, in a stable order"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for fname in sorted(filenames):
+            if fname.lower().endswith(extensions):
+                yield os.path.join(dirpath, fname)
+
+
+def token_spans(text, tokenizer=None):
+    """(start, end) character span of every token; whitespace-separated words without a fast tokenizer"""
+    if tokenizer is not None and getattr(tokenizer, "is_fast", False):
+        enc = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+        return [(s, e) for s, e in enc["offset_mapping"] if e > s]
+    return [m.span() for m in _WORD_RE.finditer(text)]
+
+
+def chunk_text(text, tokenizer=None, chunk_tokens=200, overlap=40):
+    """Yield (start, end, chunk) windows of at most chunk_tokens tokens"""
+    if overlap >= chunk_tokens:
+        raise ValueError("overlap must be smaller than chunk_tokens")
+    spans = token_spans(text, tokenizer)
+    step = chunk_tokens - overlap
+    for first in range(0, max(len(spans) - overlap, 1), step):
+        window = spans[first:first + chunk_tokens]
+        if not window:
+            break
+        start, end = window[0][0], window[-1][1]
+        yield start, end, text[start:end]
+
+
+def file_chunks(path, root, tokenizer=None, chunk_tokens=200, overlap=40):
+    """Chunk docs for one file, shaped for RAGIndex.upsert"""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    extra = {}
+    if os.path.exists(path + ".meta.json"):
+        with open(path + ".meta.json", "r", encoding="utf-8") as f:
+            extra = json.load(f)
+    rel = os.path.relpath(path, root).replace(os.sep, "/")
+    for n, (start, end, chunk) in enumerate(chunk_text(text, tokenizer, chunk_tokens, overlap)):
+        yield {
+            "id": f"{rel}#{n}",
+            "text": chunk,
+            "meta": {**extra, "src": rel, "chunk": n, "start": start, "end": end},
+        }
+
+
+def _model_tokenizer(rag):
+    return getattr(rag.model, "tokenizer", None)
+
+
+def ingest(rag: RAGIndex, root, full=False, extensions=DEFAULT_EXTENSIONS, chunk_tokens=200, overlap=40,
+           batch_size=64, flush_every=20_000, workers=1, log=print):
+    """
+    Stream every file under root into rag. full=True drops the index first;
+    otherwise only new/changed chunks are embedded. Returns a stats dict.
+    """
+    started = time.perf_counter()
+    paths = list(discover_files(root, extensions))
+    stats = {"files": len(paths), "chunks": 0, "added": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+
+    if full:
+        rag.reset()
+        stored = {}
+    else:
+        lost = rag.recover()
+        if lost:
+            log(f"{lost} chunks from an interrupted run were never saved to the index; re-embedding them")
+        stored = {doc_id: (h, meta) for doc_id, _, h, meta in rag.docs.fingerprints()}
+    size_hint = 0
+    if rag.index is None or rag.index.ntotal == 0:
+        total_chars = sum(os.path.getsize(p) for p in paths)
+        size_hint = max(1, total_chars // (_CHARS_PER_TOKEN * (chunk_tokens - overlap)))
+        if rag.index_kind == "auto":
+            rag.index_kind = choose_index_kind(size_hint)
+
+    tokenizer = _model_tokenizer(rag)
+    pool = rag.model.start_multi_process_pool(["cpu"] * workers) if workers > 1 else None
+    pending = []
+    seen = set()
+
+    def flush():
+        embs = rag._encode([d["text"] for d in pending], batch_size=batch_size, pool=pool)
+        rag.upsert(pending, save=False, embeddings=embs, size_hint=size_hint)
+        pending.clear()
+        rate = stats["chunks"] / max(time.perf_counter() - started, 1e-9)
+        log(f"{stats['chunks']} chunks processed ({rate:,.0f} chunks/s)")
+
+    try:
+        for path in paths:
+            for doc in file_chunks(path, root, tokenizer, chunk_tokens, overlap):
+                stats["chunks"] += 1
+                seen.add(doc["id"])
+                h = content_hash(doc["text"])
+                old = stored.get(doc["id"])
+                if old is None:
+                    stats["added"] += 1
+                elif old != (h, doc["meta"]):
+                    stats["updated"] += 1
+                else:
+                    stats["unchanged"] += 1
+                    continue
+                pending.append({**doc, "hash": h})
+                if len(pending) >= flush_every:
+                    flush()
+        if pending:
+            flush()
+    finally:
+        if pool is not None:
+            rag.model.stop_multi_process_pool(pool)
+
+    stale = [doc_id for doc_id in stored if doc_id not in seen]
+    stats["deleted"] = rag.delete(stale, save=False)
+    if stats["added"] or stats["updated"] or stats["deleted"]:
+        rag.save()
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    return stats
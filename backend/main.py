@@ -1,39 +1,300 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from backend.pii import mask_pii
-from backend.rag import RAGIndex, load_seed_docs
-from backend.db import init_db, create_user, get_purchases_for_user, add_purchase
-from backend.utils import nearest_stores
+from backend.ingest import ingest
+from backend.rag import RAGIndex, code_terms, filter_key, normalize_query
+from backend.db import (
+    init_db, create_user, create_users, get_user_profile, get_user_profiles, add_purchase, purchase_writer,
+    recency_spend_now,
+)
+from backend.stores import StoreCatalog
+from backend.batcher import RetrievalBatcher
+from backend.context import from_env as context_assembler_from_env
+from backend.response_cache import bucket_key, context_version, from_env as response_cache_from_env
+from backend import metrics
+from backend.metrics import span, timed
+import asyncio
+import contextvars
+import functools
 import json
+import logging
 import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-import requests
-from typing import Optional
+import httpx
+from typing import List, Optional
 
 # ----------------------------
 # Load environment variables
 # ----------------------------
 load_dotenv()
-init_db()  # Initialize DB tables
+
+logger = logging.getLogger(__name__)
 
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 GROQ_MODEL_NAME = os.environ.get("GROQ_MODEL_NAME") or "your_groq_model_name_here"
+GROQ_API_URL = os.environ.get("GROQ_API_URL", "https://api.groq.ai/v1")
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "groq")  # "groq" or "local" (backend/generator.py)
+
+# ----------------------------
+# Executors + pooled HTTP client
+# ----------------------------
+# Blocking SQLite calls and CPU-bound encode/search never run on the event loop
+db_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("DB_WORKERS", "8")), thread_name_prefix="db")
+cpu_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("CPU_WORKERS", "2")), thread_name_prefix="cpu")
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive client for LLM calls (created on first use)"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=int(os.environ.get("LLM_MAX_CONNECTIONS", "64")),
+                max_keepalive_connections=int(os.environ.get("LLM_MAX_KEEPALIVE", "32")),
+            ),
+        )
+    return _http_client
+
+
+async def run_blocking(executor, fn, *args, **kwargs):
+    """Run a blocking call in `executor` and await its result (spans inside count towards the request)"""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(executor, ctx.run, functools.partial(fn, *args, **kwargs))
 
-app = FastAPI(title="H-002 Hyper-Personalized Customer Agent")
 
 # ----------------------------
-# RAG index
+# RAG index (model + index are loaded by the warm-up task, not at import)
 # ----------------------------
 BASE_DIR = os.path.dirname(__file__)
 rag = RAGIndex(
-    index_path=os.path.join(BASE_DIR, "faiss_index.index"),
-    meta_path=os.path.join(BASE_DIR, "meta.json"),
+    index_path=os.environ.get("RAG_INDEX_PATH", os.path.join(BASE_DIR, "faiss_index.index")),
+    meta_path=os.environ.get("RAG_META_PATH", os.path.join(BASE_DIR, "meta.db")),
+    index_kind=os.environ.get("RAG_INDEX_KIND", "auto"),
+    mode=os.environ.get("RAG_MODE", "hybrid"),
+    encoder=os.environ.get("RAG_ENCODER", "torch"),
+)
+
+# Concurrent requests share one batched encode + search
+retriever = RetrievalBatcher(
+    rag,
+    max_batch=int(os.environ.get("RAG_BATCH_MAX", "32")),
+    max_wait_ms=float(os.environ.get("RAG_BATCH_WAIT_MS", "5")),
+    executor=cpu_executor,
 )
-if not rag.load():
-    # Build from seed docs if index not found
-    docs = load_seed_docs(os.path.join(BASE_DIR, "..", "data", "seed_docs"))
-    rag.build_from_docs(docs)
+
+# ----------------------------
+# Store catalog (loaded once, reloaded when stores.json changes)
+# ----------------------------
+store_catalog = StoreCatalog(os.environ.get("STORES_FILE", os.path.join(BASE_DIR, "..", "data", "stores.json")))
+SEED_DOCS_DIR = os.environ.get("SEED_DOCS_DIR", os.path.join(BASE_DIR, "..", "data", "seed_docs"))
+
+# Prompt context packed into a token budget, counted with the target model's tokenizer when known
+context_assembler = context_assembler_from_env(os.environ.get("LOCAL_LLM_MODEL", "gpt2") if LLM_BACKEND == "local" else None)
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "5"))  # candidates for the assembler to rank
+
+# Semantic cache of LLM replies (RESPONSE_CACHE=memory|sqlite|off)
+response_cache = response_cache_from_env(os.path.join(BASE_DIR, "response_cache.db"))
+
+# /api/chat/batch: items prepared together per chunk, LLM calls in flight at once, items per request
+CHAT_BATCH_CHUNK = int(os.environ.get("CHAT_BATCH_CHUNK", "256"))
+CHAT_BATCH_CONCURRENCY = int(os.environ.get("CHAT_BATCH_CONCURRENCY", "16"))
+CHAT_BATCH_MAX_ITEMS = int(os.environ.get("CHAT_BATCH_MAX_ITEMS", "100000"))
+
+# Retrieval only considers docs of stores within this radius of the user (0 disables)
+RAG_GEO_RADIUS_M = float(os.environ.get("RAG_GEO_RADIUS_M", "25000"))
+RAG_GEO_MAX_STORES = int(os.environ.get("RAG_GEO_MAX_STORES", "200"))
+
+
+# ----------------------------
+# Metrics: per-stage histograms at /metrics, X-Debug-Timings, sampled profiles
+# ----------------------------
+DEBUG_TIMINGS = os.environ.get("DEBUG_TIMINGS", "request")  # off | request (when asked for) | always
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))  # fraction of /api requests profiled
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+_profiling = threading.Lock()  # one sampled profile at a time
+
+
+def _generator_stats():
+    generator = sys.modules.get("backend.generator")  # only once LLM_BACKEND=local has loaded it
+    if generator is None or generator._generator is None:
+        return None
+    gen = generator._generator
+    return {**gen.stats, "queue_depth": gen._queue.qsize(), "active_streams": gen.active_streams}
+
+
+metrics.register_gauge("executor_queue_depth", "Calls waiting for an executor thread", lambda: {
+    "db": db_executor._work_queue.qsize(), "cpu": cpu_executor._work_queue.qsize()}, label="executor")
+metrics.register_gauge("purchase_writer_queue_depth", "Purchases waiting to be committed", lambda: purchase_writer.qsize())
+metrics.register_gauge("purchase_writer", "Purchases queued, committed and dropped after failed writes",
+                       purchase_writer.stats, label="stat")
+metrics.register_gauge("rag_index_vectors", "Vectors in the FAISS index", lambda: rag.index.ntotal if rag.index is not None else None)
+metrics.register_gauge("rag_query_cache", "Query embedding cache", lambda: rag.query_cache.stats(), label="stat")
+metrics.register_gauge("rag_result_cache", "Retrieval result cache", lambda: rag.result_cache.stats(), label="stat")
+metrics.register_gauge("retrieval_batcher", "Retrieval micro-batching", lambda: retriever.stats(), label="stat")
+metrics.register_gauge("context_token_count_cache", "Context token count cache", lambda: context_assembler.counts.stats(), label="stat")
+metrics.register_gauge("response_cache", "Semantic LLM response cache",
+                       lambda: response_cache.stats() if response_cache is not None else None, label="stat")
+metrics.register_gauge("local_generator", "Local generator batching", _generator_stats, label="stat")
+
+
+def rag_filters(location: dict = None):
+    """Retrieval filters for a user location: nearby stores' docs plus docs tied to no store"""
+    if not location or RAG_GEO_RADIUS_M <= 0:
+        return None
+    return {"store_ids": store_catalog.ids_within_radius(
+        location.get("lat"), location.get("lng"), RAG_GEO_RADIUS_M, limit=RAG_GEO_MAX_STORES
+    )}
+
+
+def stores_near(location: dict):
+    """(3 nearest stores, retrieval filters) for a user location"""
+    nearest = store_catalog.nearest(location.get("lat"), location.get("lng"), k=3)
+    return nearest, rag_filters(location)
+
+
+# ----------------------------
+# Lifecycle: bind the port right away, warm up in the background
+# ----------------------------
+components = {name: {"status": "pending"} for name in ("db", "stores", "rag", "llm")}
+ready_event = asyncio.Event()
+warm_up_failed = asyncio.Event()
+
+
+def _warm_rag():
+    if not rag.load(mmap=os.environ.get("RAG_MMAP", "1") == "1"):
+        # Build from seed docs if index not found
+        ingest(rag, SEED_DOCS_DIR, full=True)
+    rag.embed_query("warm up")  # loads the model and runs one encode
+    rag.retrieve("warm up", k=RAG_TOP_K)  # touches the index pages
+
+
+def _warm_llm():
+    context_assembler.load_tokenizer()
+    if LLM_BACKEND == "local":
+        from backend import generator
+
+        gen = generator.get_generator()
+        gen.load()
+        gen.generate("warm up", max_new_tokens=1)
+
+
+WARMUP_ATTEMPTS = int(os.environ.get("WARMUP_ATTEMPTS", "5"))
+WARMUP_BACKOFF_S = float(os.environ.get("WARMUP_BACKOFF_S", "1"))  # doubles after each failed attempt, up to 60s
+
+
+async def _warm_component(name, executor, fn):
+    """Warm one component, retrying with exponential backoff; True once it is ready"""
+    delay = WARMUP_BACKOFF_S
+    for attempt in range(1, WARMUP_ATTEMPTS + 1):
+        started = time.perf_counter()
+        try:
+            await run_blocking(executor, fn)
+            components[name] = {"status": "ready", "seconds": round(time.perf_counter() - started, 3)}
+            return True
+        except Exception as e:
+            failed = attempt == WARMUP_ATTEMPTS
+            components[name] = {"status": "error" if failed else "retrying", "error": str(e), "attempts": attempt}
+            if not failed:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+    return False
+
+
+async def warm_up():
+    results = await asyncio.gather(
+        _warm_component("db", db_executor, init_db),
+        _warm_component("stores", cpu_executor, store_catalog.__len__),
+        _warm_component("rag", cpu_executor, _warm_rag),
+        _warm_component("llm", cpu_executor, _warm_llm),
+    )
+    if all(results):
+        ready_event.set()
+    else:
+        warm_up_failed.set()  # /live fails so the orchestrator restarts the process
+
+
+@asynccontextmanager
+async def lifespan(app):
+    warm_task = asyncio.create_task(warm_up())
+    yield
+    warm_task.cancel()
+    await retriever.close()
+    if _http_client is not None:
+        await _http_client.aclose()
+    await run_blocking(db_executor, purchase_writer.stop)  # commit queued purchases before exit
+    db_executor.shutdown(wait=True)
+    cpu_executor.shutdown(wait=True)
+
+
+app = FastAPI(title="H-002 Hyper-Personalized Customer Agent", lifespan=lifespan)
+
+
+@app.get("/live")
+async def live():
+    """Liveness: the process is up and serving the event loop; 503 once warm-up has given up"""
+    if warm_up_failed.is_set():
+        return JSONResponse({"status": "warm-up failed", "components": components}, status_code=503)
+    return {"status": "alive"}
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once every component has warmed up, 503 with per-component status before"""
+    body = {"ready": ready_event.is_set(), "components": components}
+    return JSONResponse(body, status_code=200 if ready_event.is_set() else 503)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text format: per-stage latency histograms plus cache and queue gauges"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def _dump_profile(profiler, path):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump(path)
+
+
+@app.middleware("http")
+async def timings_middleware(request: Request, call_next):
+    """
+    Time /api requests stage by stage. The timings go out in X-Debug-Timings
+    (always, or when the request sends `X-Debug-Timings: 1`, per DEBUG_TIMINGS);
+    a PROFILE_SAMPLE_RATE fraction of requests is also profiled into PROFILE_DIR
+    as collapsed stacks (until the response starts, for streams).
+    """
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+
+    timings = metrics.start_request()
+    profiler = None
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE and _profiling.acquire(blocking=False):
+        profiler = metrics.SamplingProfiler().start()
+    try:
+        with span("total"):
+            response = await call_next(request)
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            _profiling.release()
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.url.path.strip('/').replace('/', '_')}-{os.urandom(2).hex()}.folded"
+            await run_blocking(db_executor, _dump_profile, profiler, os.path.join(PROFILE_DIR, name))
+
+    if DEBUG_TIMINGS == "always" or (DEBUG_TIMINGS == "request" and request.headers.get("x-debug-timings") == "1"):
+        response.headers["X-Debug-Timings"] = metrics.format_timings(timings)
+    return response
 
 
 # ----------------------------
@@ -47,61 +308,90 @@ class ChatRequest(BaseModel):
     track_purchase: Optional[dict] = None  # {"store_name": str, "category": str, "amount": float}
 
 
+class BatchChatItem(BaseModel):
+    user_id: Optional[str] = None
+    message: Optional[str] = None  # defaults to the batch message
+    location: Optional[dict] = None
+
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem]
+    message: Optional[str] = None  # shared message for items without their own (campaign pushes)
+    include_context: Optional[bool] = False
+
+
 # ----------------------------
 # Helper functions
 # ----------------------------
-def build_rag_context(user_message: str, user_id: str = None, location: dict = None) -> str:
+def _top(counts: dict, n: int = 3) -> list:
+    return sorted(counts.items(), key=lambda kv: (-kv[1], kv[0]))[:n]
+
+
+def favourites(profile) -> dict:
+    """The stable part of a purchase profile (top items/stores), used to version cached replies"""
+    if profile is None or not profile.purchase_count:
+        return None
+    return {
+        "items": [name for name, _ in _top(profile.category_counts or {})],
+        "stores": [name for name, _ in _top(profile.store_counts or {})],
+    }
+
+
+def format_profile(profile) -> str:
+    """Purchase profile block (one precomputed row, whatever the history length)"""
+    if profile is None or not profile.purchase_count:
+        return None
+    visits = profile.store_last_visit or {}
+    profile_text = f"Past purchases ({profile.purchase_count} total):\n"
+    profile_text += "- Favourite items: " + ", ".join(
+        f"{name} ({n})" for name, n in _top(profile.category_counts or {})) + "\n"
+    profile_text += "- Favourite stores: " + ", ".join(
+        f"{name} ({n}, last visit {visits.get(name, '')[:10]})" for name, n in _top(profile.store_counts or {})) + "\n"
+    profile_text += f"- Last purchase: {profile.last_purchase_at.strftime('%Y-%m-%d')}"
+    profile_text += f" | Recent spend: {recency_spend_now(profile):.2f}\n"
+    return profile_text
+
+
+def format_context(retrieved: list, nearest: list, profile=None) -> str:
     """
-    Build the context for LLM including:
-    - RAG seed docs
-    - Nearest stores + promos
-    - Past user purchases
+    Render retrieved docs, nearby stores and the user's purchase profile into
+    the LLM context: near-duplicates dropped, best pieces packed into the
+    CONTEXT_TOKEN_BUDGET.
     """
-    context_parts = []
+    context, _ = context_assembler.assemble(
+        retrieved,
+        nearest,
+        format_profile(profile),
+        profile.last_purchase_at if profile is not None else None,
+    )
+    return context
 
-    # 1️⃣ Seed docs from RAG
-    retrieved = rag.retrieve(user_message, k=3)
-    if retrieved:
-        retrieved_text = "\n".join([r["text"] for r in retrieved])
-        context_parts.append("Seed docs:\n" + retrieved_text)
 
-    # 2️⃣ Nearest stores
-    stores_file = os.path.join(BASE_DIR, "..", "data", "stores.json")
-    stores_list = []
-    try:
-        with open(stores_file, "r", encoding="utf-8") as f:
-            stores_list = json.load(f)
-    except FileNotFoundError:
-        pass
-
-    if location and stores_list:
-        nearest = nearest_stores(location.get("lat"), location.get("lng"), stores_list, max_results=3)
-        store_text = "Nearby stores:\n"
-        for s in nearest:
-            store_text += f"- {s['name']} ({s['distance_m']}m away) | Promos: "
-            store_text += ", ".join([p["desc"] for p in s.get("promos", [])]) + "\n"
-        context_parts.append(store_text)
+def build_prompt(masked_message: str, context: str) -> str:
+    return f"""
+You are a helpful retail assistant. Only use the context provided.
+User message: {masked_message}
+Context: {context}
+Answer concisely, friendly, and suggest the best store based on user history and location.
+"""
 
-    # 3️⃣ Past purchases
-    if user_id:
-        purchases = get_purchases_for_user(user_id, limit=5)
-        if purchases:
-            purchase_text = "Past purchases:\n"
-            for p in purchases:
-                purchase_text += f"- {p.store_name} at {p.timestamp.strftime('%Y-%m-%d')} | {p.category}\n"
-            context_parts.append(purchase_text)
 
-    return "\n".join(context_parts)
+async def generate_reply(chat: dict) -> str:
+    """LLM reply for a prepared chat, from Groq or the local model"""
+    with span("llm_call"):
+        if LLM_BACKEND == "local":
+            return await generate_local(chat["masked_message"], chat["context"])
+        return await generate_with_groq(chat["prompt"])
 
 
-def generate_with_groq(prompt: str) -> str:
+async def generate_with_groq(prompt: str) -> str:
     """
     Send the prompt to Groq API and get generated response.
     """
     if not GROQ_API_KEY or not GROQ_MODEL_NAME:
         raise RuntimeError("GROQ_API_KEY and GROQ_MODEL_NAME must be set")
 
-    url = f"https://api.groq.ai/v1/models/{GROQ_MODEL_NAME}/generate"
+    url = f"{GROQ_API_URL}/models/{GROQ_MODEL_NAME}/generate"
     headers = {"Authorization": f"Bearer {GROQ_API_KEY}"}
     payload = {
         "prompt": prompt,
@@ -109,7 +399,7 @@ def generate_with_groq(prompt: str) -> str:
         "temperature": 0.7
     }
 
-    response = requests.post(url, headers=headers, json=payload, timeout=30)
+    response = await get_http_client().post(url, headers=headers, json=payload)
     if response.status_code != 200:
         raise RuntimeError(f"Groq API Error: {response.text}")
     data = response.json()
@@ -117,79 +407,479 @@ def generate_with_groq(prompt: str) -> str:
     return data.get("output_text", data.get("text", ""))
 
 
+async def generate_local(masked_message: str, context: str) -> str:
+    """Reply from the batched local generator (backend/generator.py)"""
+    from backend import generator  # heavy import, only needed for LLM_BACKEND=local
+
+    output = await asyncio.wrap_future(generator.submit_response(masked_message, context))
+    return generator.clean_reply(output)
+
+
+async def stream_with_groq(prompt: str):
+    """
+    Stream the completion from Groq, yielding text pieces as they arrive.
+    Expects `data: {...}` SSE lines; a non-streaming JSON reply is yielded whole.
+    """
+    if not GROQ_API_KEY or not GROQ_MODEL_NAME:
+        raise RuntimeError("GROQ_API_KEY and GROQ_MODEL_NAME must be set")
+
+    url = f"{GROQ_API_URL}/models/{GROQ_MODEL_NAME}/generate"
+    headers = {"Authorization": f"Bearer {GROQ_API_KEY}", "Accept": "text/event-stream"}
+    payload = {
+        "prompt": prompt,
+        "max_output_tokens": 256,
+        "temperature": 0.7,
+        "stream": True,
+    }
+
+    async with get_http_client().stream("POST", url, headers=headers, json=payload) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise RuntimeError(f"Groq API Error: {response.text}")
+
+        if "text/event-stream" not in response.headers.get("content-type", ""):
+            await response.aread()
+            data = response.json()
+            yield data.get("output_text", data.get("text", ""))
+            return
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            chunk = line[len("data:"):].strip()
+            if chunk == "[DONE]":
+                break
+            data = json.loads(chunk)
+            piece = data.get("text") or data.get("output_text")
+            if piece is None and data.get("choices"):
+                piece = (data["choices"][0].get("delta") or {}).get("content")
+            if piece:
+                yield piece
+
+
 # ----------------------------
 # Chat endpoint
 # ----------------------------
-@app.post("/api/chat")
-async def chat_endpoint(req: ChatRequest):
+async def prepare_chat(req: ChatRequest) -> dict:
+    """
+    Everything up to the LLM call: PII masking, user get-or-create, purchase
+    tracking, nearest stores, RAG retrieval, context and prompt.
+    """
     if not req.message:
         raise HTTPException(400, "Message required")
+    if not ready_event.is_set():
+        raise HTTPException(503, "Warming up, retry shortly", headers={"Retry-After": "2"})
 
     # 1️⃣ Mask PII in user message
-    masked_message = mask_pii(req.message)
+    with span("pii_mask"):
+        masked_message = mask_pii(req.message)
 
     # 2️⃣ Handle new / returning users
     if req.new_user or not req.user_id:
         user_id = f"user_{os.urandom(4).hex()}"
-        user = create_user(user_id=user_id)
     else:
         user_id = req.user_id
-        user = create_user(user_id=user_id)  # also acts like "get or create"
-
-    # 3️⃣ Track purchase if user clicked "I'm going"
-    if req.track_purchase:
-        add_purchase(
-            user_id=user_id,
-            store_name=req.track_purchase.get("store_name"),
-            category=req.track_purchase.get("category"),
-            amount=req.track_purchase.get("amount", 0.0)
+    with span("user_get_or_create"):
+        await run_blocking(db_executor, create_user, user_id=user_id)  # also acts like "get or create"
+
+    # 3️⃣ Track purchase if user clicked "I'm going", then load the profile (in that order)
+    def track_and_load_profile():
+        if req.track_purchase:
+            with span("purchase_tracking"):
+                add_purchase(
+                    user_id=user_id,
+                    store_name=req.track_purchase.get("store_name"),
+                    category=req.track_purchase.get("category"),
+                    amount=req.track_purchase.get("amount", 0.0)
+                )
+        with span("profile_load"):
+            return get_user_profile(user_id)
+
+    # 4️⃣ Nearest stores for dynamic recommendations and the retrieval filter (KD-tree; may reload stores.json)
+    nearest, filters = [], None
+    if req.location:
+        with span("nearest_stores"):
+            nearest, filters = await run_blocking(cpu_executor, stores_near, req.location)
+
+    # 5️⃣ Build dynamic RAG context: profile lookup and retrieval run concurrently
+    profile, retrieved = await asyncio.gather(
+        run_blocking(db_executor, track_and_load_profile),
+        timed("rag_retrieve", retriever.retrieve(masked_message, k=RAG_TOP_K, filters=filters)),
+    )
+    with span("context_build"):
+        context = format_context(retrieved, nearest, profile)
+
+    # 6️⃣ Compose final prompt
+    prompt = build_prompt(masked_message, context)
+    return {
+        "user_id": user_id,
+        "masked_message": masked_message,
+        "nearest": nearest,
+        "context": context,
+        "prompt": prompt,
+        "store_ids": [s.get("store_id") for s in nearest],
+        "context_version": context_version(nearest, retrieved, favourites(profile)),
+    }
+
+
+def semantic_cacheable(masked_message: str) -> bool:
+    """
+    Promo-code / SKU questions bypass the response cache: hybrid retrieval
+    answers them without embedding the query, and an embedding barely tells
+    COCO10 from COCO20 anyway.
+    """
+    return not code_terms(masked_message)
+
+
+async def cache_reply(chat: dict, q_emb, reply: str, latency_s: float):
+    """Add a generated reply to the response cache; a failed write is logged and the reply still goes out"""
+    if q_emb is None:
+        return
+    try:
+        await run_blocking(
+            cpu_executor, response_cache.add, q_emb, chat["store_ids"], chat["context_version"], reply, latency_s,
         )
+    except Exception:
+        logger.exception("Response cache write failed")
+
+
+def lookup_cached_reply(chat: dict):
+    """
+    (query embedding, (reply, similarity) or None); the embedding is usually
+    already cached by retrieval. (None, None) for queries that are not
+    semantic_cacheable.
+    """
+    if not semantic_cacheable(chat["masked_message"]):
+        return None, None
+    q_emb = rag.embed_query(chat["masked_message"])
+    return q_emb, response_cache.lookup(q_emb, chat["store_ids"], chat["context_version"])
+
+
+@app.post("/api/chat")
+async def chat_endpoint(req: ChatRequest):
+    chat = await prepare_chat(req)
+
+    # 7️⃣ Reuse a reply to a near-identical question in the same context, if any
+    hit = None
+    if response_cache is not None:
+        with span("response_cache_lookup"):
+            q_emb, hit = await run_blocking(cpu_executor, lookup_cached_reply, chat)
+
+    # 8️⃣ Otherwise generate reply from Groq (or the local model)
+    if hit is not None:
+        reply = hit[0]
+    else:
+        started = time.perf_counter()
+        try:
+            reply = await generate_reply(chat)
+        except Exception as e:
+            reply = f"Error generating response: {e}"
+        else:
+            if response_cache is not None and reply:
+                await cache_reply(chat, q_emb, reply, time.perf_counter() - started)
+
+    # 9️⃣ API response
+    response = {
+        "reply": reply,
+        "context_used": chat["context"],
+        "user_id": chat["user_id"],
+        "store_recommendations": chat["nearest"]  # 🔥 added to enable button actions
+    }
+    if response_cache is not None:
+        response["response_cache"] = {
+            "hit": hit is not None,
+            "similarity": round(hit[1], 4) if hit else None,
+            **response_cache.stats(),
+        }
+    return response
+
+
+# ----------------------------
+# Streaming chat endpoint (Server-Sent Events)
+# ----------------------------
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def stream_local(masked_message: str, context: str):
+    """
+    Relay tokens from the local transformers generator. The relay gets its own
+    thread (the generator caps how many run) so long streams never hold
+    cpu_executor threads that retrieval and cache lookups need.
+    """
+    from backend import generator  # heavy import, only needed for LLM_BACKEND=local
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    done = object()
 
-    # 4️⃣ Load stores for dynamic recommendations
-    stores_file = os.path.join(BASE_DIR, "..", "data", "stores.json")
-    stores_list = []
+    def produce():
+        try:
+            for piece in generator.stream_response(masked_message, context, stop_event=stop):
+                loop.call_soon_threadsafe(queue.put_nowait, piece)
+        except Exception as e:
+            loop.call_soon_threadsafe(queue.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    threading.Thread(target=produce, name="llm-stream", daemon=True).start()
     try:
-        with open(stores_file, "r", encoding="utf-8") as f:
-            stores_list = json.load(f)
-    except FileNotFoundError:
-        pass
-
-    nearest = []
-    if req.location and stores_list:
-        nearest = nearest_stores(
-            req.location.get("lat"),
-            req.location.get("lng"),
-            stores_list,
-            max_results=3
+        while True:
+            piece = await queue.get()
+            if piece is done:
+                break
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+    finally:
+        stop.set()  # client went away or we finished: stop generating
+
+
+@app.post("/api/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest, request: Request):
+    """
+    Same pipeline as /api/chat, streamed: a `meta` event with store
+    recommendations and context as soon as they are ready, then `token`
+    events as the LLM produces them, then `done` with the full reply.
+    """
+    if LLM_BACKEND == "local":
+        from backend import generator  # heavy import, only needed for LLM_BACKEND=local
+
+        try:
+            generator.get_generator().check_stream_slot()
+        except generator.QueueFullError as e:
+            raise HTTPException(503, str(e), headers={"Retry-After": "1"})
+    chat = await prepare_chat(req)
+
+    async def events():
+        yield sse_event("meta", {
+            "user_id": chat["user_id"],
+            "context_used": chat["context"],
+            "store_recommendations": chat["nearest"],
+        })
+
+        if LLM_BACKEND == "local":
+            tokens = stream_local(chat["masked_message"], chat["context"])
+        else:
+            tokens = stream_with_groq(chat["prompt"])
+
+        reply = []
+        started = time.perf_counter()
+        try:
+            async for piece in tokens:
+                if await request.is_disconnected():
+                    return
+                if not reply:
+                    metrics.record("llm_first_token", time.perf_counter() - started)
+                reply.append(piece)
+                yield sse_event("token", {"text": piece})
+        except Exception as e:
+            yield sse_event("error", {"message": f"Error generating response: {e}"})
+            return
+        finally:
+            await tokens.aclose()
+        metrics.record("llm_stream", time.perf_counter() - started)
+        yield sse_event("done", {"reply": "".join(reply)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# ----------------------------
+# Batch chat endpoint (NDJSON)
+# ----------------------------
+def _mask_all(messages: list) -> list:
+    masked = {}
+    for message in messages:
+        if message not in masked:
+            masked[message] = mask_pii(message)
+    return [masked[m] for m in messages]
+
+
+def _users_and_profiles(user_ids: list) -> dict:
+    create_users(user_ids)
+    return get_user_profiles(user_ids)
+
+
+def _retrieve_all(masked: list, locations: list):
+    """
+    One batched encode for the messages retrieval or the response cache needs
+    embedded, then one retrieve_batch per distinct set of nearby-store filters.
+    Returns ((1, d) embedding or None per message, hits per message).
+    """
+    need = list(dict.fromkeys(rag.dense_queries(masked) + [m for m in masked if semantic_cacheable(m)]))
+    embeddings = dict(zip(need, rag.embed_queries(need))) if need else {}
+    by_location = {}
+    for location in locations:
+        key = (location.get("lat"), location.get("lng")) if location else None
+        if key not in by_location:
+            by_location[key] = rag_filters(location)
+    filters = [by_location[(loc.get("lat"), loc.get("lng")) if loc else None] for loc in locations]
+    groups = {}
+    for i, f in enumerate(filters):
+        groups.setdefault(filter_key(f), []).append(i)
+    retrieved = [None] * len(masked)
+    for positions in groups.values():
+        hits = rag.retrieve_batch(
+            [masked[i] for i in positions], k=RAG_TOP_K, filters=filters[positions[0]], embeddings=embeddings
         )
+        for i, item_hits in zip(positions, hits):
+            retrieved[i] = item_hits
+    q_embs = [embeddings[m].reshape(1, -1) if semantic_cacheable(m) else None for m in masked]
+    return q_embs, retrieved
 
-    # 5️⃣ Build dynamic RAG context
-    context = build_rag_context(masked_message, user_id=user_id, location=req.location)
 
-    # 6️⃣ Compose final prompt
-    prompt = f"""
-You are a helpful retail assistant. Only use the context provided.
-User message: {masked_message}
-Context: {context}
-Answer concisely, friendly, and suggest the best store based on user history and location.
-"""
+def _build_chats(start, user_ids, masked, nearest, retrieved, profiles, q_embs) -> list:
+    chats = []
+    for i, user_id in enumerate(user_ids):
+        profile = profiles[user_id]
+        context = format_context(retrieved[i], nearest[i], profile)
+        chat = {
+            "index": start + i,
+            "user_id": user_id,
+            "masked_message": masked[i],
+            "nearest": nearest[i],
+            "context": context,
+            "prompt": build_prompt(masked[i], context),
+            "store_ids": [s.get("store_id") for s in nearest[i]],
+            "context_version": context_version(nearest[i], retrieved[i], favourites(profile)),
+            "q_emb": q_embs[i],
+            "hit": None,
+        }
+        if response_cache is not None and chat["q_emb"] is not None:
+            chat["hit"] = response_cache.lookup(chat["q_emb"], chat["store_ids"], chat["context_version"])
+        chats.append(chat)
+    return chats
+
+
+async def prepare_batch(items: list, start: int, default_message: str) -> list:
+    """
+    prepare_chat() for a chunk of items: PII masking, user get-or-create and
+    profiles in one grouped query each, nearest stores in bulk, one batched
+    encode for all messages, contexts and response cache lookups.
+    """
+    user_ids = [item.user_id or f"user_{os.urandom(4).hex()}" for item in items]
+    locations = [item.location for item in items]
+    points = [(loc.get("lat"), loc.get("lng")) if loc else (None, None) for loc in locations]
+    with span("batch_pii_mask"):
+        masked = await run_blocking(cpu_executor, _mask_all, [item.message or default_message for item in items])
+
+    profiles, nearest, (q_embs, retrieved) = await asyncio.gather(
+        timed("batch_users_profiles", run_blocking(db_executor, _users_and_profiles, user_ids)),
+        timed("batch_nearest_stores", run_blocking(cpu_executor, store_catalog.batch_nearest, points, 3)),
+        timed("batch_rag_retrieve", run_blocking(cpu_executor, _retrieve_all, masked, locations)),
+    )
+    with span("batch_context_build"):
+        return await run_blocking(cpu_executor, _build_chats, start, user_ids, masked, nearest, retrieved, profiles, q_embs)
 
-    # 7️⃣ Generate reply from Groq
+
+async def _batch_line(chat: dict, reply_for, include_context: bool) -> dict:
+    line = {"index": chat["index"], "user_id": chat["user_id"], "store_recommendations": chat["nearest"]}
+    if include_context:
+        line["context_used"] = chat["context"]
     try:
-        reply = generate_with_groq(prompt)
+        line["reply"], line["response_cache"] = await reply_for(chat)
     except Exception as e:
-        reply = f"Error generating response: {e}"
+        line["error"] = f"Error generating response: {e}"
+    return line
 
-    # 8️⃣ API response
-    return {
-        "reply": reply,
-        "context_used": context,
-        "user_id": user_id,
-        "store_recommendations": nearest  # 🔥 added to enable button actions
-    }
+
+async def run_chat_batch(batch: BatchChatRequest):
+    """
+    Yield one NDJSON line per item as its reply completes (with its `index`).
+    Chunks of CHAT_BATCH_CHUNK items are prepared together; the next chunk is
+    prepared while the LLM works through the previous one, with at most
+    CHAT_BATCH_CONCURRENCY calls in flight. With the response cache on,
+    items whose normalized message and context bucket match share one LLM
+    call within the batch.
+    """
+    lines = asyncio.Queue()
+    done = object()
+    sem = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+    shared = {}  # (bucket, normalized message) -> task generating that reply
+
+    async def generate(chat):
+        async with sem:
+            started = time.perf_counter()
+            reply = await generate_reply(chat)
+        if response_cache is not None and reply:
+            await cache_reply(chat, chat["q_emb"], reply, time.perf_counter() - started)
+        return reply
+
+    async def reply_for(chat):
+        if chat["hit"] is not None:
+            return chat["hit"][0], "hit"
+        if response_cache is None:
+            return await generate(chat), "miss"
+        key = (bucket_key(chat["store_ids"], chat["context_version"]), normalize_query(chat["masked_message"]))
+        task = shared.get(key)
+        if task is not None:
+            return await asyncio.shield(task), "shared"
+        task = shared[key] = asyncio.ensure_future(generate(chat))
+        return await asyncio.shield(task), "miss"
+
+    async def emit(chat):
+        await lines.put(await _batch_line(chat, reply_for, batch.include_context))
+
+    async def produce():
+        pending = set()
+        try:
+            for start in range(0, len(batch.items), CHAT_BATCH_CHUNK):
+                chats = await prepare_batch(batch.items[start:start + CHAT_BATCH_CHUNK], start, batch.message)
+                for chat in chats:
+                    task = asyncio.ensure_future(emit(chat))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+                while len(pending) > CHAT_BATCH_CHUNK:  # keep at most about two chunks in memory
+                    await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if pending:
+                await asyncio.wait(pending)
+        except Exception as e:
+            await lines.put({"error": f"Batch failed: {e}"})
+        finally:
+            for task in list(pending) + list(shared.values()):
+                task.cancel()
+            await lines.put(done)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            line = await lines.get()
+            if line is done:
+                break
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+    finally:
+        producer.cancel()  # client went away: stop preparing and generating
+
+
+@app.post("/api/chat/batch")
+async def chat_batch_endpoint(batch: BatchChatRequest):
+    """
+    Replies for many users at once (campaign pushes), streamed as NDJSON:
+    {"index", "user_id", "reply", "store_recommendations", "response_cache"}
+    per item, in completion order; failed items carry "error" instead of "reply".
+    """
+    if not batch.items:
+        raise HTTPException(400, "items required")
+    if len(batch.items) > CHAT_BATCH_MAX_ITEMS:
+        raise HTTPException(413, f"At most {CHAT_BATCH_MAX_ITEMS} items per batch")
+    if not batch.message and not all(item.message for item in batch.items):
+        raise HTTPException(400, "Message required for every item (or a batch message)")
+    if not ready_event.is_set():
+        raise HTTPException(503, "Warming up, retry shortly", headers={"Retry-After": "2"})
+    return StreamingResponse(run_chat_batch(batch), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
     import uvicorn
 
-    uvicorn.run("backend.main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run(
+        "backend.main:app",
+        host="0.0.0.0",
+        port=int(os.environ.get("PORT", "8000")),
+        reload=os.environ.get("UVICORN_RELOAD") == "1",  # dev only: reload forks a watcher process
+    )
@@ -0,0 +1,187 @@
+# backend/metrics.py
+"""
+Lightweight request instrumentation, no external dependencies.
+
+    with span("rag_search"):
+        ...
+
+Every span is observed in the `chat_stage_seconds{stage=...}` histogram and,
+when a request is being timed (start_request()), added to that request's
+timings so they can be returned in the X-Debug-Timings header. The current
+request's timings dict lives in a context variable; run_blocking copies the
+context into executor threads so spans there are attributed too. Work
+batched across requests (RetrievalBatcher) only feeds the histograms.
+
+render() produces the Prometheus text exposition format for the histograms
+plus any gauges registered with register_gauge().
+
+SamplingProfiler is a small wall-clock sampler: while running it records the
+stacks of all threads every `interval` seconds and writes them in collapsed
+("folded") format, ready for flamegraph.pl / speedscope. Samples from
+concurrent requests sharing the event loop thread are not separated.
+"""
+
+import contextvars
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label="stage", buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series = {}  # label value -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += seconds
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._series.items()}
+        for value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{value}"'
+            for bound, n in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {n}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series[-2]}')
+            lines.append(f"{self.name}_count{{{label}}} {series[-2]}")
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]:.6f}")
+        return lines
+
+
+stage_seconds = Histogram("chat_stage_seconds", "Time spent per request stage")
+_gauges = []  # (name, help, fn returning a number or {label_value: number}, label)
+
+
+def register_gauge(name, help_text, fn, label=None):
+    """fn() returns a number, or {label value: number} when label is given"""
+    _gauges.append((name, help_text, fn, label))
+
+
+def _fmt(value):
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    return repr(value) if value != int(value) else str(int(value))
+
+
+def render():
+    lines = stage_seconds.render()
+    for name, help_text, fn, label in _gauges:
+        try:
+            value = fn()
+        except Exception:
+            continue  # a component that is not up yet
+        if value is None:
+            continue
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        if label:
+            lines += [f'{name}{{{label}="{k}"}} {_fmt(v)}' for k, v in sorted(value.items())]
+        else:
+            lines.append(f"{name} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# -------------------------
+# Spans
+# -------------------------
+def start_request():
+    """Begin collecting per-stage timings for the current context; returns the dict"""
+    timings = {}
+    _timings.set(timings)
+    return timings
+
+
+def current_timings():
+    return _timings.get()
+
+
+def record(stage, seconds):
+    stage_seconds.observe(stage, seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+async def timed(stage, awaitable):
+    """Await inside a span, for stages started with asyncio.gather"""
+    with span(stage):
+        return await awaitable
+
+
+def format_timings(timings):
+    """X-Debug-Timings header value: stage=milliseconds pairs"""
+    return ", ".join(f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in timings.items())
+
+
+# -------------------------
+# Sampling profiler
+# -------------------------
+class SamplingProfiler:
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.samples
+
+    def dump(self, path):
+        """Write collapsed stacks ("frame;frame;frame count" per line)"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
@@ -1,30 +1,153 @@
+"""
+PII masking engine shared by the API (placeholders) and the local generator
+(partial masks, see pii_masker.py).
+
+One combined regex scan finds email addresses and phone *candidates*; only the
+candidates go through phonenumbers validation (or, with leniency=None, the
+digit layout check of the original chat masker), and the output is built in a
+single pass. Text with no digit and no "@" is returned untouched without
+scanning at all. mask_pii_spans() also returns where each match was in the
+input and in the output so masked text can be mapped back.
+"""
+
 import re
+from typing import List, NamedTuple, Tuple
+
 import phonenumbers
+from phonenumbers import Leniency
 from phonenumbers.phonenumberutil import NumberParseException
 
 PHONE_PLACEHOLDER = "<PHONE_MASKED>"
 EMAIL_PLACEHOLDER = "<EMAIL_MASKED>"
 
-email_re = re.compile(r"[\w\.-]+@[\w\.-]+")
+_EMAIL = r"(?P<email>(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)*)"
+# digits with the usual separators; deliberately loose, phonenumbers decides
+_PHONE = r"(?P<phone>\+?\(?\d[\d\s().-]{5,}\d)"
 
+email_re = re.compile(_EMAIL)
+phone_candidate_re = re.compile(_PHONE)
+_PII_RE = re.compile(f"{_EMAIL}|{_PHONE}")
+_DIGIT_RE = re.compile(r"\d")
+_MIN_PHONE_DIGITS = 7
+# leniency=None: [country code] 3-3-4 digits with optional separators, no phonenumbers lookup
+_PHONE_LAYOUT_RE = re.compile(r"(?:\+?\d{1,3})?[-. (]*\d{3}[-. )]*\d{3}[-. ]*\d{4}")
 
-def mask_emails(text: str) -> str:
-    return email_re.sub(EMAIL_PLACEHOLDER, text)
 
+class PIIMatch(NamedTuple):
+    kind: str  # "email" | "phone"
+    start: int
+    end: int
 
-def mask_phones(text: str, default_region="US") -> str:
-    # Use phonenumbers to detect international phones
-    out = text
+
+class PIISpan(NamedTuple):
+    kind: str
+    start: int  # in the input
+    end: int
+    out_start: int  # in the masked output
+    out_end: int
+
+
+def _scanner(text: str):
+    """Cheapest regex that can match anything in text (None: nothing to mask)"""
+    if not text:
+        return None
+    has_at = "@" in text
+    has_digit = _DIGIT_RE.search(text) is not None
+    if has_at and has_digit:
+        return _PII_RE
+    if has_at:
+        return email_re
+    if has_digit:
+        return phone_candidate_re
+    return None
+
+
+def _phones_in(candidate: str, offset: int, region: str, leniency) -> List[PIIMatch]:
+    digits = sum(c.isdigit() for c in candidate)
+    if digits < _MIN_PHONE_DIGITS:
+        return []
+    if leniency is None:
+        return [PIIMatch("phone", offset + m.start(), offset + m.end()) for m in _PHONE_LAYOUT_RE.finditer(candidate)]
+    # common case: the candidate is exactly one number
     try:
-        for match in phonenumbers.PhoneNumberMatcher(text, default_region):
-            s = match.raw_string
-            out = out.replace(s, PHONE_PLACEHOLDER)
+        number = phonenumbers.parse(candidate, region)
+        ok = phonenumbers.is_valid_number(number) if leniency == Leniency.VALID else phonenumbers.is_possible_number(number)
+        if ok:
+            return [PIIMatch("phone", offset, offset + len(candidate))]
     except NumberParseException:
         pass
-    return out
+    if candidate.isdigit():
+        return []
+    # separators may join a number with neighbouring digits ("555-123-4567 2 items")
+    try:
+        return [
+            PIIMatch("phone", offset + m.start, offset + m.end)
+            for m in phonenumbers.PhoneNumberMatcher(candidate, region, leniency=leniency)
+        ]
+    except NumberParseException:
+        return []
+
+
+def find_pii(text: str, default_region: str = "US", leniency=Leniency.VALID, kinds=("email", "phone")) -> List[PIIMatch]:
+    """
+    Non-overlapping PII matches in text order. leniency is a phonenumbers
+    Leniency, or None to accept phone numbers on their digit layout alone.
+    """
+    scanner = _scanner(text)
+    if scanner is None:
+        return []
+    matches = []
+    for m in scanner.finditer(text):
+        kind = m.lastgroup
+        if kind not in kinds:
+            continue
+        if kind == "email":
+            matches.append(PIIMatch("email", m.start(), m.end()))
+        else:
+            matches.extend(_phones_in(m.group(), m.start(), default_region, leniency))
+    return matches
+
+
+def placeholder_mask(kind: str, value: str) -> str:
+    return EMAIL_PLACEHOLDER if kind == "email" else PHONE_PLACEHOLDER
+
+
+def partial_mask(kind: str, value: str) -> str:
+    """john@example.com → j***@example.com, +1-987-654-3210 → +*-***-***-**10 (separators kept)"""
+    if kind == "email":
+        name, domain = value.split("@", 1)
+        return f"{name[0]}***@{domain}"
+    digits = [i for i, c in enumerate(value) if c.isdigit()]
+    keep = digits[-2] if len(digits) > 2 else len(value)
+    return _DIGIT_RE.sub("*", value[:keep]) + value[keep:]
+
+
+def mask_pii_spans(text: str, replace=placeholder_mask, **find_kwargs) -> Tuple[str, List[PIISpan]]:
+    """Mask PII in one pass; returns (masked_text, spans)"""
+    matches = find_pii(text, **find_kwargs)
+    if not matches:
+        return text, []
+    parts, spans = [], []
+    pos = out_len = 0
+    for kind, start, end in matches:
+        parts.append(text[pos:start])
+        out_len += start - pos
+        masked = replace(kind, text[start:end])
+        parts.append(masked)
+        spans.append(PIISpan(kind, start, end, out_len, out_len + len(masked)))
+        out_len += len(masked)
+        pos = end
+    parts.append(text[pos:])
+    return "".join(parts), spans
+
+
+def mask_emails(text: str) -> str:
+    return mask_pii_spans(text, kinds=("email",))[0]
+
+
+def mask_phones(text: str, default_region="US") -> str:
+    return mask_pii_spans(text, default_region=default_region, kinds=("phone",))[0]
 
 
 def mask_pii(text: str) -> str:
-    text = mask_emails(text)
-    text = mask_phones(text)
-    return text
+    return mask_pii_spans(text)[0]
@@ -4,37 +4,25 @@ Utility module for masking sensitive user information (PII) such as email IDs,
 phone numbers, and account identifiers before sending data to an AI model.
 """
 
-import re
+from .pii import mask_pii_spans, partial_mask
 
-EMAIL_REGEX = re.compile(r"[a-zA-Z0-9.+_-]+@[a-zA-Z0-9._-]+\.[a-zA-Z0-9._-]+")
-PHONE_REGEX = re.compile(r"(?:\+?\d{1,3})?[-. (]*\d{3}[-. )]*\d{3}[-. ]*\d{4}")
+# Masks are partial (the model still sees the shape of the value). Phone
+# numbers are recognised by their 10+ digit layout, as this masker always
+# did, so order and reference numbers pass through and no phonenumbers
+# lookup is needed.
+_OPTS = dict(replace=partial_mask, leniency=None)
 
 
 def mask_email(text: str) -> str:
     """Mask emails like john@example.com → j***@example.com"""
-    def repl(match):
-        email = match.group(0)
-        name, domain = email.split("@")
-        return f"{name[0]}***@{domain}"
-    return EMAIL_REGEX.sub(repl, text)
+    return mask_pii_spans(text, kinds=("email",), **_OPTS)[0]
 
 
 def mask_phone(text: str) -> str:
-    """Mask phone numbers like +1-987-654-3210 → ***-***-**10"""
-    matches = PHONE_REGEX.findall(text)
-    for m in matches:
-        digits = re.sub(r"\D", "", m)
-        if len(digits) < 4:  # ignore invalid
-            continue
-        masked = "*" * (len(digits) - 2) + digits[-2:]
-        text = text.replace(m, masked)
-    return text
+    """Mask phone numbers like +1-987-654-3210 → +*-***-***-**10"""
+    return mask_pii_spans(text, kinds=("phone",), **_OPTS)[0]
 
 
 def mask_pii(text: str) -> str:
     """Master wrapper to mask ALL supported PII"""
-    if not text:
-        return text
-    text = mask_email(text)
-    text = mask_phone(text)
-    return text
+    return mask_pii_spans(text, **_OPTS)[0]
@@ -0,0 +1,177 @@
+# backend/pii_scrub.py
+"""
+Bulk PII scrubbing for transcripts, seed documents and request logs.
+
+    python -m backend.pii_scrub transcripts.jsonl -o transcripts.masked.jsonl
+    python -m backend.pii_scrub app.log -o app.masked.log --workers 8
+    cat requests.jsonl | python -m backend.pii_scrub - --fields body,title > out.jsonl
+
+Input is read line by line and cut into chunks that a process pool masks in
+parallel; results are written back in input order. At most a few chunks per
+worker are in flight, so memory stays bounded whatever the input size.
+
+JSONL lines have their string values masked (all of them, or only --fields);
+other lines are masked as plain text. The format follows the file extension;
+--fields implies JSONL (stdin has no extension) and is rejected for text. Lines that are not valid JSON in a JSONL
+input are masked as text too.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from phonenumbers import Leniency
+
+from .pii import mask_pii_spans, partial_mask
+
+STYLES = {
+    "placeholder": {},
+    "partial": dict(replace=partial_mask, leniency=Leniency.POSSIBLE),
+}
+
+
+def _mask_text(text, opts, stats):
+    masked, spans = mask_pii_spans(text, **opts)
+    for span in spans:
+        stats[span.kind] += 1
+    return masked
+
+
+def _mask_value(value, opts, stats):
+    if isinstance(value, str):
+        return _mask_text(value, opts, stats)
+    if isinstance(value, list):
+        return [_mask_value(v, opts, stats) for v in value]
+    if isinstance(value, dict):
+        return {k: _mask_value(v, opts, stats) for k, v in value.items()}
+    return value
+
+
+def scrub_chunk(lines, fmt="text", style="placeholder", fields=None):
+    """Mask one chunk of lines; returns (masked_lines, Counter of matches per type)"""
+    opts = STYLES[style]
+    stats = Counter()
+    out = []
+    for line in lines:
+        body = line.rstrip("\n")
+        newline = line[len(body):]
+        if fmt == "jsonl" and body.strip():
+            try:
+                record = json.loads(body)
+            except ValueError:
+                record = None
+                stats["invalid_json"] += 1
+            if record is not None:
+                if fields and isinstance(record, dict):
+                    for field in fields:
+                        if field in record:
+                            record[field] = _mask_value(record[field], opts, stats)
+                else:
+                    record = _mask_value(record, opts, stats)
+                out.append(json.dumps(record, ensure_ascii=False) + newline)
+                continue
+        out.append(_mask_text(body, opts, stats) + newline)
+    return out, stats
+
+
+def _chunks(lines, size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def scrub_lines(lines, fmt="text", style="placeholder", fields=None, workers=None, chunk_lines=2000, stats=None):
+    """
+    Yield masked lines in input order.
+    workers: process count (None = all cores, 1 = in-process)
+    stats: optional Counter updated with per-type match counts and "lines"
+    """
+    stats = stats if stats is not None else Counter()
+    workers = workers or os.cpu_count() or 1
+    chunks = _chunks(lines, chunk_lines)
+
+    if workers == 1:
+        for chunk in chunks:
+            out, chunk_stats = scrub_chunk(chunk, fmt, style, fields)
+            stats.update(chunk_stats)
+            stats["lines"] += len(out)
+            yield from out
+        return
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(scrub_chunk, chunk, fmt, style, fields))
+            if len(pending) >= max_in_flight:
+                out, chunk_stats = pending.popleft().result()
+                stats.update(chunk_stats)
+                stats["lines"] += len(out)
+                yield from out
+        while pending:
+            out, chunk_stats = pending.popleft().result()
+            stats.update(chunk_stats)
+            stats["lines"] += len(out)
+            yield from out
+
+
+def scrub_file(src, dst, fmt=None, **kwargs):
+    """Scrub src into dst ("-" = stdin/stdout); returns the stats Counter"""
+    if fmt is None:
+        fmt = "jsonl" if kwargs.get("fields") or str(src).endswith((".jsonl", ".ndjson")) else "text"
+    elif fmt == "text" and kwargs.get("fields"):
+        raise ValueError("fields only apply to JSONL input")
+    stats = Counter()
+    fin = sys.stdin if src == "-" else open(src, "r", encoding="utf-8", errors="replace")
+    fout = sys.stdout if dst == "-" else open(dst + ".tmp", "w", encoding="utf-8")
+    try:
+        fout.writelines(scrub_lines(fin, fmt=fmt, stats=stats, **kwargs))
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+    if dst != "-":
+        os.replace(dst + ".tmp", dst)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mask PII in JSONL or text files")
+    parser.add_argument("src", help='input file ("-" for stdin)')
+    parser.add_argument("-o", "--out", default="-", help='output file (default "-" = stdout)')
+    parser.add_argument("--format", choices=("jsonl", "text"), help="default: from the file extension")
+    parser.add_argument("--style", choices=tuple(STYLES), default="placeholder")
+    parser.add_argument("--fields", help="comma-separated JSONL fields to mask (default: every string value); implies --format jsonl")
+    parser.add_argument("--workers", type=int, help="processes (default: all cores)")
+    parser.add_argument("--chunk-lines", type=int, default=2000)
+    args = parser.parse_args(argv)
+    if args.fields and args.format == "text":
+        parser.error("--fields only applies to --format jsonl")
+
+    t = time.perf_counter()
+    stats = scrub_file(
+        args.src,
+        args.out,
+        fmt=args.format,
+        style=args.style,
+        fields=args.fields.split(",") if args.fields else None,
+        workers=args.workers,
+        chunk_lines=args.chunk_lines,
+    )
+    elapsed = time.perf_counter() - t
+    summary = dict(stats, seconds=round(elapsed, 2), lines_per_s=round(stats["lines"] / max(elapsed, 1e-9)))
+    print(json.dumps(summary), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,673 @@
 # backend/rag.py
 import os
+import re
 import json
+import hashlib
 import faiss
-from sentence_transformers import SentenceTransformer
+import numpy as np
+
+from .cache import LRUCache
+from .docstore import DocStore
+from .encoders import DEFAULT_MODEL, Encoder, check_compatible, get_encoder
+from .metrics import span
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a query: case-folded with whitespace collapsed"""
+    return " ".join(query.lower().split())
+
+
+# -------------------------
+# Retrieval modes
+# -------------------------
+RETRIEVAL_MODES = ("dense", "lexical", "hybrid")
+
+# promo codes / SKUs: a token mixing letters and digits, e.g. COCO10, SKU-1234
+_CODE_RE = re.compile(r"(?<![\w-])(?=[\w-]*\d)(?=[\w-]*[A-Za-z])[A-Za-z0-9][\w-]{3,}")
+
+
+def code_terms(query: str) -> list:
+    return _CODE_RE.findall(query)
+
+
+def rrf_fuse(rankings, k=60):
+    """Reciprocal rank fusion of several best-first id lists; returns [(id, score)] best first"""
+    scores = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+# -------------------------
+# Index factory
+# -------------------------
+INDEX_KINDS = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def choose_index_kind(n_vectors: int) -> str:
+    """Pick an index type from corpus size: exact search while it is cheap, ANN beyond"""
+    if n_vectors < 50_000:
+        return "flat"
+    if n_vectors < 2_000_000:
+        return "hnsw"
+    return "ivf_pq"
+
+
+# k-means points per centroid below which faiss warns that training is unreliable
+MIN_POINTS_PER_CENTROID = 39
+
+
+def index_factory_string(kind: str, dim: int, n_vectors: int, n_train: int = None) -> str:
+    """
+    faiss.index_factory description for an index kind. Every variant accepts
+    add_with_ids: IVF indexes natively, Flat/HNSW through IDMap2.
+    n_train: vectors the index will be trained on (default n_vectors).
+    """
+    if kind == "flat":
+        return "IDMap2,Flat"
+    if kind == "hnsw":
+        return "IDMap2,HNSW32"
+
+    # ~4*sqrt(n) lists, but no more than the training set gives enough points for
+    centroids = max(1, (n_train or n_vectors) // MIN_POINTS_PER_CENTROID)
+    nlist = max(1, min(int(4 * n_vectors ** 0.5), centroids))
+    if kind == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if kind == "ivf_pq":
+        m = next((m for m in (64, 48, 32, 24, 16, 8, 4, 2, 1) if dim % m == 0 and dim // m >= 4), 1)
+        nbits = max(1, min(8, centroids.bit_length() - 1))
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    raise ValueError(f"Unknown index kind {kind!r}, expected one of {INDEX_KINDS} or 'auto'")
+
+
+def make_index(kind: str, dim: int, n_vectors: int, n_train: int = None):
+    """Create an empty inner-product index; returns (index, factory_string)"""
+    factory = index_factory_string(kind, dim, n_vectors, n_train)
+    return faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT), factory
+
+
+def enable_reconstruct(index):
+    """
+    Give an IVF index the direct map it needs to look vectors up by id
+    (filtered exact scans, compaction). Done when the index is created or
+    loaded, never while search threads share it; the map is saved with it.
+    """
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return index  # Flat/HNSW under IDMap2 reconstruct by id already
+    if ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def search_params(kind: str, nprobe: int = None, ef_search: int = None, sel=None):
+    """
+    Per-query search parameters for an index kind (None for unrestricted
+    exact search). `sel` is a faiss.IDSelector restricting the search to
+    the ids it accepts.
+    """
+    extra = {"sel": sel} if sel is not None else {}
+    if kind in ("ivf_flat", "ivf_pq") and nprobe:
+        return faiss.SearchParametersIVF(nprobe=nprobe, **extra)
+    if kind == "hnsw" and ef_search:
+        return faiss.SearchParametersHNSW(efSearch=ef_search, **extra)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def filter_key(filters):
+    """Hashable, order-independent form of a retrieval filters dict (None when unfiltered)"""
+    if not filters:
+        return None
+    return tuple(sorted(
+        (key, tuple(sorted(str(v) for v in value)) if isinstance(value, (list, tuple, set, frozenset)) else value)
+        for key, value in filters.items()
+    ))
 
 
 class RAGIndex:
-    def __init__(self, index_path="data/faiss.index", meta_path="data/meta.json"):
+    """
+    FAISS index with stable integer IDs so single documents can be upserted
+    or deleted without re-embedding the whole corpus.
+
+    Doc text/metadata live in a SQLite DocStore at meta_path keyed by the
+    FAISS int id; retrieve() only reads the rows for the hits it returns.
+
+    index_kind is one of INDEX_KINDS or "auto" (chosen from corpus size at
+    build time). The resolved kind and factory string are saved next to the
+    index file as <index_path>.cfg.json and restored by load().
+
+    mode picks the retrieval strategy (RETRIEVAL_MODES): "dense" FAISS
+    search, "lexical" BM25 over the DocStore's FTS5 table, or "hybrid"
+    reciprocal rank fusion of both. In hybrid mode a query containing a
+    promo code / SKU that docs match exactly is answered from the lexical
+    index alone, without embedding the query.
+
+    filters restrict a retrieval to docs by meta store_id / doc_type (see
+    DocStore.filter_ids). They are applied inside the search: the matching
+    int ids become a FAISS IDSelector (or, up to exact_filter_max ids, an
+    exact scan of just their vectors, kept for the filter_vector_cache_size
+    most recent filters) and an FTS rowid constraint, so k hits come back
+    whenever k docs match.
+
+    HNSW graphs cannot drop nodes, so docs deleted or replaced there are
+    tombstoned: their old vectors stay in the graph under int ids no doc uses
+    any more (replaced docs get new int ids), searches skip them through an
+    IDSelector, and the graph is rebuilt without them once they make up
+    compact_ratio of it (or on compact()). Doc rows commit before the index
+    is saved, so writers call recover() after load() to clean up after a run
+    that died in between.
+
+    encoder is a backend name from encoders.ENCODER_BACKENDS (or an Encoder).
+    The index records the encoder's vector space in its cfg.json and load()
+    raises EncoderMismatchError for an encoder from another space.
+
+    Query embeddings are cached by normalized query text, and top-k results
+    by (query, k, mode, filters, search params, index version). Every mutation bumps
+    `version` and drops the result cache. Callers pass PII-masked queries
+    (main.py masks before retrieval), so no raw PII ends up in the caches.
+    """
+
+    def __init__(self, index_path="data/faiss.index", meta_path="data/meta.db",
+                 index_kind="auto", nprobe=16, ef_search=64, mode="hybrid", rrf_k=60, exact_filter_max=10_000,
+                 compact_ratio=0.2, filter_vector_cache_size=4,
+                 query_cache_size=2048, result_cache_size=1024, cache_ttl=600,
+                 model_name=DEFAULT_MODEL, encoder="torch"):
         self.index_path = index_path
         self.meta_path = meta_path
+        self.index_kind = index_kind
+        self.factory = None
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode {mode!r}, expected one of {RETRIEVAL_MODES}")
+        self.mode = mode
+        self.rrf_k = rrf_k
+        self.exact_filter_max = exact_filter_max
+        self.compact_ratio = compact_ratio
+        self.index = None
+        self.tombstones = set()  # int ids still in the index whose docs are gone
+        self._tombstone_sel = None
+        self.mmapped = False
+        self.docs = DocStore(meta_path)
+        self.version = 0
+        self.query_cache = LRUCache(query_cache_size, ttl=cache_ttl)
+        self.result_cache = LRUCache(result_cache_size, ttl=cache_ttl)
+        self.filter_cache = LRUCache(256, ttl=cache_ttl)
+        # (filter, version) -> stored vectors of the allowed ids, for the exact scan. An entry is up
+        # to exact_filter_max x d float32 (~15 MB at 10k x 384), so keep only a handful
+        self.filter_vector_cache = LRUCache(filter_vector_cache_size, ttl=cache_ttl)
+        self.encoder = encoder if isinstance(encoder, Encoder) else get_encoder(encoder, model_name)
+        self.model_name = self.encoder.model_name
+
+    @property
+    def model(self):
+        """The encoder's SentenceTransformer, loaded on first use rather than in __init__"""
+        return self.encoder.model
+
+    @property
+    def config_path(self):
+        return self.index_path + ".cfg.json"
+
+    @property
+    def legacy_meta_path(self):
+        return os.path.splitext(self.meta_path)[0] + ".json"
+
+    def _bump_version(self):
+        self.version += 1
+        self.result_cache.clear()
+        self.filter_vector_cache.clear()  # large and keyed by version: free them right away
+
+    def cache_stats(self):
+        return {
+            "index_version": self.version,
+            "tombstones": len(self.tombstones),
+            "query_embeddings": self.query_cache.stats(),
+            "results": self.result_cache.stats(),
+            "filter_vectors": self.filter_vector_cache.stats(),
+        }
+
+    def _new_index(self, dim, n_vectors, n_train=None):
+        if self.index_kind == "auto":
+            self.index_kind = choose_index_kind(n_vectors)
+        index, self.factory = make_index(self.index_kind, dim, n_vectors, n_train)
+        return enable_reconstruct(index)
+
+    def _ensure_writable(self):
+        # a memory-mapped index is read-only: pull it into RAM before mutating
+        if self.mmapped:
+            self.index = enable_reconstruct(faiss.read_index(self.index_path))
+            self.mmapped = False
+
+    def _can_remove(self):
+        return self.index_kind != "hnsw"
+
+    def _remove_ids(self, ids):
+        ids = np.asarray(ids, dtype="int64")
+        if not len(ids):
+            return
+        if self._can_remove():
+            self.index.remove_ids(ids)
+            return
+        # HNSW graphs cannot drop nodes: tombstone them, rebuild once enough have piled up
+        self.tombstones.update(ids.tolist())
+        self._tombstone_sel = None
+        if len(self.tombstones) >= self.compact_ratio * self.index.ntotal:
+            self.compact()
+
+    def compact(self):
+        """Drop the tombstoned vectors (an HNSW graph is rebuilt from its live ones)"""
+        if self.index is None or not self.tombstones:
+            return
+        self._ensure_writable()
+        dead = np.fromiter(self.tombstones, dtype="int64", count=len(self.tombstones))
+        self.tombstones = set()
+        self._tombstone_sel = None
+        if self._can_remove():
+            self.index.remove_ids(dead)
+            return
+        keep = np.setdiff1d(faiss.vector_to_array(self.index.id_map), dead)
+        vecs = self.index.reconstruct_batch(keep) if len(keep) else None
+        self.index = faiss.index_factory(self.index.d, self.factory, faiss.METRIC_INNER_PRODUCT)
+        if vecs is not None:
+            self.index.add_with_ids(vecs, keep)
+
+    def _live_selector(self):
+        """IDSelector skipping tombstoned ids (None when there are none)"""
+        if not self.tombstones:
+            return None
+        if self._tombstone_sel is None:
+            dead = np.fromiter(self.tombstones, dtype="int64", count=len(self.tombstones))
+            batch = faiss.IDSelectorBatch(len(dead), faiss.swig_ptr(dead))
+            # keep the id array and the inner selector alive as long as the outer one
+            self._tombstone_sel = (faiss.IDSelectorNot(batch), batch, dead)
+        return self._tombstone_sel[0]
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Change the default query-time nprobe (IVF) / efSearch (HNSW)"""
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+
+    def _encode(self, texts, batch_size=32, pool=None):
+        """pool: a sentence-transformers multi-process pool to spread encoding over"""
+        return self.encoder.encode(texts, batch_size=batch_size, pool=pool)
+
+    def reset(self, index_kind=None):
+        """Drop the index and every stored doc (the next upsert creates a new index)"""
+        if index_kind is not None:
+            self.index_kind = index_kind
         self.index = None
-        self.metadata = []
-        self.model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+        self.mmapped = False
+        self.tombstones = set()
+        self._tombstone_sel = None
+        self.docs.clear()
+        self._bump_version()
 
-    def build_from_docs(self, docs: list):
+    def build_from_docs(self, docs: list, index_kind=None):
         # docs: list of dicts: {"id": .., "text": .., "meta": {...}}
-        texts = [d["text"] for d in docs]
-        embs = self.model.encode(texts, convert_to_numpy=True)
-        dim = embs.shape[1]
+        self.reset(index_kind)
+        self.upsert(docs)
+
+    def upsert(self, docs: list, save=True, embeddings=None, size_hint=0):
+        """
+        Insert new docs and replace existing ones (matched on doc["id"]), keeping their int ids.
+        embeddings: precomputed normalized (len(docs), d) float32 rows
+        size_hint: expected corpus size, used to size a new index when docs arrive in batches
+        (an IVF index is trained on this first batch, so its list count is also capped by the batch size)
+        """
+        if not docs:
+            return
+        embs = embeddings if embeddings is not None else self._encode([d["text"] for d in docs])
+        self._ensure_writable()
+        if self.index is None:
+            self.index = self._new_index(embs.shape[1], max(len(embs), size_hint), n_train=len(embs))
+        if not self.index.is_trained:
+            self.index.train(embs)
+
+        doc_ids = [d["id"] for d in docs]
+        replaced = list(self.docs.int_ids(doc_ids).values())
+        # an HNSW graph keeps replaced vectors (tombstoned), so replacements need new int ids
+        ids, next_id = self.docs.assign_ids(doc_ids, fresh=not self._can_remove())
+        self._remove_ids(replaced)
+        self.index.add_with_ids(embs, np.asarray(ids, dtype="int64"))
+        self._bump_version()
+        self.docs.put_many(
+            ((int_id, {**d, "hash": d.get("hash") or content_hash(d["text"])}) for int_id, d in zip(ids, docs)),
+            next_id,
+        )
+        if save:
+            self.save()
+
+    def delete(self, doc_ids: list, save=True):
+        """Remove docs by their doc["id"]; unknown ids are ignored"""
+        ids = list(self.docs.int_ids(doc_ids).values())
+        if not ids:
+            return 0
+        if self.index is not None:
+            self._ensure_writable()
+            self._remove_ids(ids)
+        self.docs.delete_many(ids)
+        self._bump_version()
+        if save:
+            self.save()
+        return len(ids)
+
+    def sync(self, docs: list):
+        """
+        Make the index match `docs`: only new or changed docs (by content hash)
+        are embedded, docs no longer present are deleted.
+        Returns counts of added / updated / deleted / unchanged docs.
+        """
+        stored = {doc_id: (h, meta) for doc_id, _, h, meta in self.docs.fingerprints()}
+        stats = {"added": 0, "updated": 0, "deleted": 0, "unchanged": 0}
+        changed = []
+        for d in docs:
+            h = content_hash(d["text"])
+            if d["id"] not in stored:
+                stats["added"] += 1
+            elif stored[d["id"]] != (h, d.get("meta") or {}):
+                stats["updated"] += 1
+            else:
+                stats["unchanged"] += 1
+                continue
+            changed.append({**d, "hash": h})
 
-        self.index = faiss.IndexFlatIP(dim)
+        present = {d["id"] for d in docs}
+        stale = [doc_id for doc_id in stored if doc_id not in present]
 
-        # normalize for IP search
-        faiss.normalize_L2(embs)
-        self.index.add(embs)
+        self.upsert(changed, save=False)
+        stats["deleted"] = self.delete(stale, save=False)
+        if changed or stale:
+            self.save()
+        return stats
 
-        self.metadata = docs
-        self.save()
+    def recover(self):
+        """
+        Undo what an interrupted writer left behind; call before updating an index
+        that was loaded from disk. Doc rows commit on upsert but their vectors only
+        on save(), so rows written since the last save are dropped (the next
+        sync/ingest sees their docs as new and embeds them again) and vectors no
+        doc uses any more are removed. Returns the number of rows dropped.
+        """
+        lost = self.docs.unsaved_ids()
+        if lost:
+            self.docs.delete_many(lost)
+        if self.index is None:
+            return len(lost)
+        stored = np.asarray(self.docs.all_int_ids(), dtype="int64")
+        self.tombstones = set(np.setdiff1d(self._index_ids(), stored).tolist())
+        self._tombstone_sel = None
+        changed = bool(lost or self.tombstones)
+        if self._can_remove() or len(self.tombstones) >= self.compact_ratio * self.index.ntotal:
+            self.compact()
+        if changed:
+            self._bump_version()
+        return len(lost)
 
     def save(self):
-        if self.index is not None:
-            faiss.write_index(self.index, self.index_path)
-
-        with open(self.meta_path, "w", encoding="utf-8") as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-
-    def load(self):
-        if os.path.exists(self.index_path) and os.path.exists(self.meta_path):
-            self.index = faiss.read_index(self.index_path)
-            with open(self.meta_path, "r", encoding="utf-8") as f:
-                self.metadata = json.load(f)
-            return True
-        return False
-
-    def retrieve(self, query: str, k=3):
-        q_emb = self.model.encode([query], convert_to_numpy=True)
-        faiss.normalize_L2(q_emb)
-
-        D, I = self.index.search(q_emb, k)
-
-        hits = []
-        for i, score in zip(I[0], D[0]):
-            if i < len(self.metadata):
-                hits.append({
-                    "score": float(score),
-                    **self.metadata[i]
-                })
-        return hits
-
-
-# tiny helper to load docs from data/seed_docs
-def load_seed_docs(path="data/seed_docs"):
-    docs = []
-    for fname in os.listdir(path):
-        if fname.endswith(".txt"):
-            with open(os.path.join(path, fname), "r", encoding="utf-8") as f:
-                text = f.read().strip()
-            docs.append({
-                "id": fname,
-                "text": text,
-                "meta": {"src": fname}
-            })
-    return docs
+        if self.index is not None and not self.mmapped:
+            # write-then-rename so workers that mmap the old file keep a valid mapping
+            tmp = self.index_path + ".tmp"
+            faiss.write_index(self.index, tmp)
+            os.replace(tmp, self.index_path)
+            with open(self.config_path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "kind": self.index_kind,
+                    "factory": self.factory,
+                    "nprobe": self.nprobe,
+                    "ef_search": self.ef_search,
+                    "encoder": self.encoder.spec(),
+                }, f)
+            self.docs.mark_saved()
+
+    def _read_index(self, mmap):
+        if mmap:
+            # IVF lists map through OnDiskInvertedLists; flat codes (Flat/HNSW storage)
+            # need the in-place flag where this faiss build has it
+            if self.index_kind in ("ivf_flat", "ivf_pq"):
+                flags = faiss.IO_FLAG_MMAP
+            else:
+                flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+            try:
+                index = faiss.read_index(self.index_path, flags | faiss.IO_FLAG_READ_ONLY)
+                self.mmapped = True
+                return enable_reconstruct(index)
+            except RuntimeError:
+                pass
+        self.mmapped = False
+        return enable_reconstruct(faiss.read_index(self.index_path))
+
+    def load(self, mmap=False):
+        """
+        Load the index and attach the doc store. With mmap=True the FAISS file
+        is memory-mapped read-only; it is copied into RAM on the first write.
+        Raises EncoderMismatchError if the index was built in another vector space.
+        """
+        # indexes saved before encoders were recorded were built by the fp32 torch model
+        built_by = {"backend": "torch", "model": self.model_name, "vector_space": f"{self.model_name}@fp32"}
+        if not os.path.exists(self.index_path):
+            return False
+        if not self.docs.exists():
+            if not os.path.exists(self.legacy_meta_path):
+                return False
+            self.docs.import_json(self.legacy_meta_path)
+
+        if os.path.exists(self.config_path):
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                cfg = json.load(f)
+            check_compatible(cfg.get("encoder", built_by), self.encoder)
+            self.index_kind = cfg["kind"]
+            self.factory = cfg["factory"]
+            self.nprobe = cfg.get("nprobe", self.nprobe)
+            self.ef_search = cfg.get("ef_search", self.ef_search)
+            self.index = self._read_index(mmap)
+            # vectors no doc uses: docs deleted or replaced since an HNSW graph was
+            # compacted, or by a run that stopped before saving the index (see recover())
+            stored = np.asarray(self.docs.all_int_ids(), dtype="int64")
+            self.tombstones = set(np.setdiff1d(self._index_ids(), stored).tolist())
+            self._tombstone_sel = None
+        else:
+            # legacy plain IndexFlatIP: re-wrap with ids equal to positions
+            check_compatible(built_by, self.encoder)
+            flat = faiss.read_index(self.index_path)
+            self.mmapped = False
+            self.index_kind = "flat"
+            self.index = self._new_index(flat.d, flat.ntotal)
+            if flat.ntotal:
+                self.index.add_with_ids(flat.reconstruct_n(0, flat.ntotal), np.arange(flat.ntotal, dtype="int64"))
+            self.save()
+        self._bump_version()
+        return True
+
+    def _index_ids(self):
+        """int64 ids of every vector in the index"""
+        if hasattr(self.index, "id_map"):
+            return faiss.vector_to_array(self.index.id_map)
+        ivf = faiss.extract_index_ivf(self.index)
+        lists = ivf.invlists
+        ids = [faiss.rev_swig_ptr(lists.get_ids(l), lists.list_size(l)).copy()
+               for l in range(ivf.nlist) if lists.list_size(l)]
+        return np.concatenate(ids) if ids else np.empty(0, dtype="int64")
+
+    def embed_queries(self, queries: list):
+        """
+        Normalized (n, d) query embeddings. Cached rows are reused and all
+        misses are encoded together in a single batch.
+        """
+        keys = [normalize_query(q) for q in queries]
+        rows = [self.query_cache.get(key) for key in keys]
+        missing = {}
+        for key, q, row in zip(keys, queries, rows):
+            if row is None:
+                missing.setdefault(key, q)
+
+        if missing:
+            with span("rag_encode"):
+                embs = self._encode(list(missing.values()))
+            fresh = {}
+            for key, emb in zip(missing, embs):
+                emb = emb.reshape(1, -1)
+                emb.setflags(write=False)  # shared between callers
+                self.query_cache.put(key, emb)
+                fresh[key] = emb
+            rows = [row if row is not None else fresh[key] for key, row in zip(keys, rows)]
+        return np.vstack(rows)
+
+    def dense_queries(self, queries: list, mode=None):
+        """
+        The queries retrieve_batch would embed: all of them in dense mode, none
+        in lexical, and in hybrid those without a promo code / SKU (which may
+        be answered from the lexical index alone).
+        """
+        mode = mode or self.mode
+        if mode == "lexical" or self.index is None or self.index.ntotal == 0:
+            return []
+        return [q for q in queries if mode == "dense" or not code_terms(q)]
+
+    def _query_embeddings(self, queries, embeddings=None):
+        """embed_queries(queries), taking rows found in `embeddings` ({query: row}) as they are"""
+        if embeddings is None:
+            return self.embed_queries(queries)
+        missing = list(dict.fromkeys(q for q in queries if q not in embeddings))
+        if missing:
+            embeddings = {**embeddings, **dict(zip(missing, self.embed_queries(missing)))}
+        return np.vstack([embeddings[q] for q in queries])
+
+    def embed_query(self, query: str):
+        """Normalized (1, d) query embedding, served from the LRU cache when possible"""
+        return self.embed_queries([query])
+
+    def retrieve(self, query: str, k=3, nprobe=None, ef_search=None, mode=None, filters=None):
+        return self.retrieve_batch([query], k=k, nprobe=nprobe, ef_search=ef_search, mode=mode, filters=filters)[0]
+
+    def _allowed_ids(self, filters):
+        """(IDSelector, int64 ids, cache key) of the docs matching filters, cached per index version"""
+        key = (filter_key(filters), self.version)
+        cached = self.filter_cache.get(key)
+        if cached is None:
+            ids = np.asarray(self.docs.filter_ids(filters), dtype="int64")
+            ids.setflags(write=False)
+            cached = (faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids)), ids, key)
+            self.filter_cache.put(key, cached)
+        return cached
+
+    def _allowed_vectors(self, allowed):
+        """(len(ids), d) stored vectors of an _allowed_ids() set, reconstructed once per filter and index version"""
+        _, ids, key = allowed
+        vecs = self.filter_vector_cache.get(key)
+        if vecs is None:
+            vecs = self.index.reconstruct_batch(ids)
+            vecs.setflags(write=False)
+            self.filter_vector_cache.put(key, vecs)
+        return vecs
+
+    def _dense_search(self, queries, depth, nprobe, ef_search, allowed=None, embeddings=None):
+        """
+        Best-first [(int_id, score)] per query from one batched encode + search.
+        allowed: from _allowed_ids. Small id sets are scored exactly against
+        their stored vectors (see _allowed_vectors); larger ones are searched with
+        the selector, widening nprobe/efSearch by the fraction filtered out
+        so graph/list traversal still reaches enough allowed ids.
+        embeddings: precomputed query rows, see retrieve_batch.
+        """
+        q_embs = self._query_embeddings(queries, embeddings)
+        sel = None
+        if allowed is not None:
+            sel, ids, _ = allowed
+            if len(ids) <= self.exact_filter_max:
+                with span("rag_search"):
+                    scores = q_embs @ self._allowed_vectors(allowed).T
+                depth = min(depth, len(ids))
+                top = np.argpartition(-scores, depth - 1, axis=1)[:, :depth]
+                out = []
+                for row, cols in enumerate(top):
+                    cols = cols[np.argsort(-scores[row, cols])]
+                    out.append([(int(ids[c]), float(scores[row, c])) for c in cols])
+                return out
+            widen = self.index.ntotal / len(ids)
+            nprobe = int(min(nprobe * widen, 1024))
+            ef_search = int(min(ef_search * widen, 2048))
+        else:
+            sel = self._live_selector()  # the filter ids above never include tombstoned ones
+        params = search_params(self.index_kind, nprobe, ef_search, sel)
+        with span("rag_search"):
+            D, I = self.index.search(q_embs, depth, params=params)
+        return [[(int(i), float(d)) for i, d in zip(I[row], D[row]) if i >= 0] for row in range(len(queries))]
+
+    def retrieve_batch(self, queries: list, k=3, nprobe=None, ef_search=None, mode=None, filters=None,
+                       embeddings=None):
+        """
+        Top-k hits for several queries: one batched encode for the uncached
+        queries, one index.search and one doc store read for all of them.
+        `filters` (shared by all the queries) is described in the class docstring.
+        embeddings: {query: (d,) or (1, d) row} already computed by embed_queries,
+        e.g. once for a batch that is then searched in several filter groups.
+        """
+        if self.index is None or self.index.ntotal == 0:
+            return [[] for _ in queries]
+        mode = mode or self.mode
+        nprobe = nprobe or self.nprobe
+        ef_search = ef_search or self.ef_search
+
+        allowed = None
+        if filters:
+            allowed = self._allowed_ids(filters)
+            if not len(allowed[1]):
+                return [[] for _ in queries]
+        results = [None] * len(queries)
+        fkey = filter_key(filters)
+        keys = [(normalize_query(q), k, mode, fkey, nprobe, ef_search, self.version) for q in queries]
+        todo = []
+        for pos, key in enumerate(keys):
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                results[pos] = [dict(h) for h in cached]
+            else:
+                todo.append(pos)
+        if not todo:
+            return results
+
+        ranked = {}  # pos -> best-first [(int_id, score)]
+        if mode == "dense":
+            dense = self._dense_search([queries[p] for p in todo], k, nprobe, ef_search, allowed, embeddings)
+            for pos, hits in zip(todo, dense):
+                ranked[pos] = hits
+        elif mode == "lexical":
+            with span("rag_lexical"):
+                for pos in todo:
+                    ranked[pos] = self.docs.search_text(queries[pos], k, filters=filters)
+        else:
+            depth = max(4 * k, 20)
+            lexical, need_dense = {}, []
+            with span("rag_lexical"):
+                for pos in todo:
+                    codes = code_terms(queries[pos])
+                    exact = self.docs.search_text(queries[pos], k, require=codes, filters=filters) if codes else []
+                    if exact:
+                        ranked[pos] = exact  # short-circuit: no query embedding
+                    else:
+                        lexical[pos] = self.docs.search_text(queries[pos], depth, filters=filters)
+                        need_dense.append(pos)
+            if need_dense:
+                dense = self._dense_search([queries[p] for p in need_dense], depth, nprobe, ef_search, allowed,
+                                           embeddings)
+                for pos, dense_hits in zip(need_dense, dense):
+                    fused = rrf_fuse([[i for i, _ in dense_hits], [i for i, _ in lexical[pos]]], self.rrf_k)
+                    ranked[pos] = fused[:k]
+
+        docs = self.docs.get_many({i for hits in ranked.values() for i, _ in hits})
+        for pos in todo:
+            hits = [{"score": score, **docs[i]} for i, score in ranked[pos] if i in docs]
+            self.result_cache.put(keys[pos], [dict(h) for h in hits])
+            results[pos] = hits
+        return results
+
@@ -0,0 +1,252 @@
+# backend/response_cache.py
+"""
+Semantic cache for LLM replies.
+
+A reply is reused when a new request falls in the same *bucket* — same set
+of nearby store ids and same context version (a hash of the promos and
+inventory of those stores, the retrieved docs and the user's favourites) —
+and its query embedding is within `threshold` cosine similarity of a cached
+query. "I'm cold" and "im so cold" near Starbucks Main St share a reply;
+the same words near other stores, or after a promo changes, do not.
+
+Entries live in a pluggable store: MemoryResponseStore (per process) or
+SQLiteResponseStore (on disk, shared by workers on one host). Both evict by
+size (least recently used) and TTL. Every bucket keeps at most
+`max_per_bucket` entries, so a lookup compares against a handful of vectors.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def context_version(nearest=None, retrieved=None, favourites=None) -> str:
+    """Hash of everything in the context that the cached reply may depend on"""
+    payload = {
+        "stores": [
+            [s.get("store_id"), s.get("promos"), s.get("inventory"), s.get("open")] for s in (nearest or [])
+        ],
+        "docs": [d.get("hash") or d.get("text") for d in (retrieved or [])],
+        "favourites": favourites,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def bucket_key(store_ids, version) -> str:
+    return ",".join(sorted(str(s) for s in store_ids)) + "|" + version
+
+
+# -------------------------
+# Stores
+# -------------------------
+class MemoryResponseStore:
+    """Entries in an OrderedDict (LRU order) with a per-bucket index"""
+
+    def __init__(self, maxsize=2048, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # id -> (bucket, emb, reply, latency_s, expires)
+        self._buckets = {}  # bucket -> [id, ...]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def _drop(self, entry_id):
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._buckets[bucket]
+        ids.remove(entry_id)
+        if not ids:
+            del self._buckets[bucket]
+
+    def candidates(self, bucket):
+        """[(entry_id, emb, reply, latency_s)] of the live entries in a bucket"""
+        now = time.monotonic()
+        with self._lock:
+            out = []
+            for entry_id in list(self._buckets.get(bucket, ())):
+                _, emb, reply, latency_s, expires = self._entries[entry_id]
+                if expires < now:
+                    self._drop(entry_id)
+                    continue
+                out.append((entry_id, emb, reply, latency_s))
+            return out
+
+    def touch(self, entry_id):
+        with self._lock:
+            if entry_id in self._entries:
+                self._entries.move_to_end(entry_id)
+
+    def add(self, bucket, emb, reply, latency_s, max_per_bucket):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (bucket, emb, reply, latency_s, time.monotonic() + self.ttl)
+            ids = self._buckets.setdefault(bucket, [])
+            ids.append(entry_id)
+            while len(ids) > max_per_bucket:
+                self._drop(ids[0])
+                self.evictions += 1
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+
+class SQLiteResponseStore:
+    """Entries in a SQLite table; last_used drives LRU eviction, created the TTL"""
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS responses (
+        id        INTEGER PRIMARY KEY,
+        bucket    TEXT NOT NULL,
+        emb       BLOB NOT NULL,
+        reply     TEXT NOT NULL,
+        latency_s REAL NOT NULL,
+        created   REAL NOT NULL,
+        last_used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_responses_bucket ON responses (bucket);
+    CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used);
+    CREATE INDEX IF NOT EXISTS ix_responses_created ON responses (created);
+    """
+    SWEEP_EVERY = 64  # inserts between TTL / size sweeps
+
+    def __init__(self, path, maxsize=20000, ttl=3600):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._adds = 0
+        self.evictions = 0
+
+    @property
+    def conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def candidates(self, bucket):
+        rows = self.conn.execute(
+            "SELECT id, emb, reply, latency_s FROM responses WHERE bucket = ? AND created >= ?",
+            (bucket, time.time() - self.ttl),
+        ).fetchall()
+        return [(entry_id, np.frombuffer(emb, dtype="float32"), reply, latency_s) for entry_id, emb, reply, latency_s in rows]
+
+    def touch(self, entry_id):
+        with self._write_lock, self.conn:
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+
+    def add(self, bucket, emb, reply, latency_s, max_per_bucket):
+        now = time.time()
+        with self._write_lock, self.conn:
+            conn = self.conn
+            conn.execute(
+                "INSERT INTO responses (bucket, emb, reply, latency_s, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (bucket, np.asarray(emb, dtype="float32").tobytes(), reply, latency_s, now, now),
+            )
+            self.evictions += conn.execute(
+                "DELETE FROM responses WHERE bucket = ? AND id NOT IN "
+                "(SELECT id FROM responses WHERE bucket = ? ORDER BY id DESC LIMIT ?)",
+                (bucket, bucket, max_per_bucket),
+            ).rowcount
+            self._adds += 1
+            if self._adds % self.SWEEP_EVERY == 0:
+                self.evictions += conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,)).rowcount
+                self.evictions += conn.execute(
+                    "DELETE FROM responses WHERE id IN "
+                    "(SELECT id FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,),
+                ).rowcount
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        with self._write_lock, self.conn:
+            self.conn.execute("DELETE FROM responses")
+
+
+# -------------------------
+# Cache
+# -------------------------
+class SemanticResponseCache:
+    def __init__(self, store, threshold=0.92, max_per_bucket=32):
+        """threshold: minimum cosine similarity between normalized query embeddings for a hit"""
+        self.store = store
+        self.threshold = threshold
+        self.max_per_bucket = max_per_bucket
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency_s = 0.0
+
+    def lookup(self, query_emb, store_ids, version):
+        """Return (reply, similarity) for the closest cached query above threshold, else None"""
+        candidates = self.store.candidates(bucket_key(store_ids, version))
+        if candidates:
+            embs = np.vstack([emb for _, emb, _, _ in candidates])
+            sims = embs @ np.asarray(query_emb, dtype="float32").ravel()
+            best = int(np.argmax(sims))
+            if sims[best] >= self.threshold:
+                entry_id, _, reply, latency_s = candidates[best]
+                self.store.touch(entry_id)
+                with self._lock:
+                    self.hits += 1
+                    self.saved_latency_s += latency_s
+                return reply, float(sims[best])
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def add(self, query_emb, store_ids, version, reply, latency_s):
+        emb = np.array(query_emb, dtype="float32").ravel()
+        self.store.add(bucket_key(store_ids, version), emb, reply, latency_s, self.max_per_bucket)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self.store),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "saved_latency_s": round(self.saved_latency_s, 3),
+            "evictions": self.store.evictions,
+        }
+
+
+def from_env(default_path):
+    """Build the cache from RESPONSE_CACHE* env vars; None when RESPONSE_CACHE=off"""
+    environ = os.environ
+    kind = environ.get("RESPONSE_CACHE", "memory")
+    if kind == "off":
+        return None
+    ttl = float(environ.get("RESPONSE_CACHE_TTL", "3600"))
+    if kind == "sqlite":
+        store = SQLiteResponseStore(
+            environ.get("RESPONSE_CACHE_PATH", default_path),
+            maxsize=int(environ.get("RESPONSE_CACHE_SIZE", "20000")),
+            ttl=ttl,
+        )
+    elif kind == "memory":
+        store = MemoryResponseStore(maxsize=int(environ.get("RESPONSE_CACHE_SIZE", "2048")), ttl=ttl)
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE {kind!r}, expected memory, sqlite or off")
+    return SemanticResponseCache(store, threshold=float(environ.get("RESPONSE_CACHE_THRESHOLD", "0.92")))
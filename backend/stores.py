@@ -0,0 +1,278 @@
+# backend/stores.py
+"""
+In-memory store catalog.
+
+Loads data/stores.json once, reloads it when the file's mtime changes and
+answers nearest / within-radius queries through a KD-tree built over
+unit-sphere coordinates (chord distance is monotonic in great-circle distance,
+so no special casing is needed for the antimeridian or the poles).
+batch_nearest answers many points at once through utils.batch_nearest
+over the catalog's lat/lng array.
+"""
+
+import heapq
+import json
+import math
+import os
+import threading
+
+import numpy as np
+
+from . import utils
+from .metrics import span
+
+EARTH_RADIUS_M = 6371000
+
+
+# -------------------------
+# Geometry helpers
+# -------------------------
+def to_unit_vector(lat, lng):
+    """Convert lat/lng in degrees to an (x, y, z) point on the unit sphere"""
+    phi = math.radians(lat)
+    lam = math.radians(lng)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def chord_to_meters(chord):
+    """Great-circle distance in meters for a chord length on the unit sphere"""
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, chord / 2.0))
+
+
+def meters_to_chord(meters):
+    """Chord length on the unit sphere for a great-circle distance in meters"""
+    return 2 * math.sin(min(meters / EARTH_RADIUS_M, math.pi) / 2.0)
+
+
+def _sq_dist(a, b):
+    dx = a[0] - b[0]
+    dy = a[1] - b[1]
+    dz = a[2] - b[2]
+    return dx * dx + dy * dy + dz * dz
+
+
+# -------------------------
+# KD-tree
+# -------------------------
+class KDTree:
+    """
+    Static 3-d KD-tree. Leaves hold small buckets of point indices so most of
+    the work happens in tight loops instead of per-node recursion.
+    """
+
+    def __init__(self, points, leaf_size=16):
+        self.points = points
+        self.leaf_size = leaf_size
+        self.root = self._build(list(range(len(points)))) if points else None
+
+    def _build(self, idxs):
+        if len(idxs) <= self.leaf_size:
+            return (None, None, idxs, None)
+
+        pts = self.points
+        # split along the axis with the largest spread
+        spreads = []
+        for axis in range(3):
+            vals = [pts[i][axis] for i in idxs]
+            spreads.append(max(vals) - min(vals))
+        axis = spreads.index(max(spreads))
+
+        idxs.sort(key=lambda i: pts[i][axis])
+        mid = len(idxs) // 2
+        split = pts[idxs[mid]][axis]
+        return (axis, split, self._build(idxs[:mid]), self._build(idxs[mid:]))
+
+    def query(self, point, k):
+        """Return [(squared_chord, index), ...] for the k nearest points, closest first"""
+        if self.root is None or k <= 0:
+            return []
+        heap = []  # max-heap on distance via negated keys
+        self._knn(self.root, point, k, heap)
+        return sorted((-d, i) for d, i in heap)
+
+    def _knn(self, node, q, k, heap):
+        axis, split, left, right = node
+        if axis is None:
+            pts = self.points
+            for i in left:
+                d = _sq_dist(q, pts[i])
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d, i))
+                elif d < -heap[0][0]:
+                    heapq.heapreplace(heap, (-d, i))
+            return
+
+        diff = q[axis] - split
+        near, far = (left, right) if diff < 0 else (right, left)
+        self._knn(near, q, k, heap)
+        if len(heap) < k or diff * diff < -heap[0][0]:
+            self._knn(far, q, k, heap)
+
+    def query_radius(self, point, radius):
+        """Return [(squared_chord, index), ...] for points within `radius` (chord), closest first"""
+        if self.root is None:
+            return []
+        out = []
+        self._radius(self.root, point, radius * radius, out)
+        out.sort()
+        return out
+
+    def _radius(self, node, q, r2, out):
+        axis, split, left, right = node
+        if axis is None:
+            pts = self.points
+            for i in left:
+                d = _sq_dist(q, pts[i])
+                if d <= r2:
+                    out.append((d, i))
+            return
+
+        diff = q[axis] - split
+        near, far = (left, right) if diff < 0 else (right, left)
+        self._radius(near, q, r2, out)
+        if diff * diff <= r2:
+            self._radius(far, q, r2, out)
+
+
+# -------------------------
+# Store catalog
+# -------------------------
+def dedupe_stores(stores_list):
+    """
+    Collapse duplicate entries. Two entries are the same store when they share
+    a store_id, or when their normalized names match at (roughly) the same
+    location. Missing fields on the first entry are filled from later ones.
+    """
+    merged = []
+    seen = {}
+    for raw in stores_list:
+        if raw.get("lat") is None or raw.get("lng") is None:
+            continue
+        store = {k: v for k, v in raw.items() if k != "distance_m"}  # drop stale precomputed distances
+
+        keys = []
+        if store.get("store_id"):
+            keys.append(("id", store["store_id"]))
+        if store.get("name"):
+            keys.append(("name", utils.normalize_name(store["name"]),
+                         round(float(store["lat"]), 3), round(float(store["lng"]), 3)))
+
+        pos = next((seen[key] for key in keys if key in seen), None)
+        if pos is None:
+            pos = len(merged)
+            merged.append(store)
+        else:
+            for field, value in store.items():
+                merged[pos].setdefault(field, value)
+        for key in keys:
+            seen.setdefault(key, pos)
+    return merged
+
+
+_UNLOADED = object()
+
+
+class StoreCatalog:
+    """
+    Store catalog loaded once from a JSON file and reloaded when its mtime
+    changes. Queries return fresh dicts with `distance_m` set; the catalog
+    entries themselves are never mutated.
+    """
+
+    def __init__(self, path, leaf_size=16):
+        self.path = path
+        self.leaf_size = leaf_size
+        self._lock = threading.Lock()
+        # (mtime, stores, tree, coords) swapped as one object so readers see a consistent snapshot
+        self._state = (_UNLOADED, [], None, None)
+
+    def _current(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        state = self._state
+        if state[0] == mtime:
+            return state
+
+        with self._lock:
+            state = self._state
+            if state[0] == mtime:
+                return state
+            with span("store_load"):
+                stores = []
+                if mtime is not None:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        stores = dedupe_stores(json.load(f))
+                points = [to_unit_vector(float(s["lat"]), float(s["lng"])) for s in stores]
+                coords = np.array([[s["lat"], s["lng"]] for s in stores], dtype="float64").reshape(-1, 2)
+                coords.setflags(write=False)
+                self._state = (mtime, stores, KDTree(points, self.leaf_size), coords)
+            return self._state
+
+    @property
+    def stores(self):
+        """Snapshot of the de-duplicated catalog entries"""
+        return list(self._current()[1])
+
+    def __len__(self):
+        return len(self._current()[1])
+
+    def _results(self, stores, hits):
+        return [dict(stores[i], distance_m=int(chord_to_meters(math.sqrt(d)))) for d, i in hits]
+
+    def nearest(self, lat, lng, k=3):
+        """Return the k nearest stores to (lat, lng), closest first"""
+        _, stores, tree, _ = self._current()
+        if lat is None or lng is None or not stores:
+            return []
+        hits = tree.query(to_unit_vector(float(lat), float(lng)), k)
+        return self._results(stores, hits)
+
+    def within_radius(self, lat, lng, radius_m, limit=None):
+        """Return stores within radius_m meters of (lat, lng), closest first"""
+        _, stores, tree, _ = self._current()
+        if lat is None or lng is None or not stores:
+            return []
+        hits = tree.query_radius(to_unit_vector(float(lat), float(lng)), meters_to_chord(radius_m))
+        if limit is not None:
+            hits = hits[:limit]
+        return self._results(stores, hits)
+
+    def ids_within_radius(self, lat, lng, radius_m, limit=None):
+        """store_ids of within_radius(), without building the result dicts"""
+        _, stores, tree, _ = self._current()
+        if lat is None or lng is None or not stores:
+            return []
+        hits = tree.query_radius(to_unit_vector(float(lat), float(lng)), meters_to_chord(radius_m))
+        return [stores[i]["store_id"] for _, i in hits[:limit] if stores[i].get("store_id")]
+
+    def coordinates(self):
+        """Read-only (n, 2) [lat, lng] array of the catalog entries, in `stores` order"""
+        return self._current()[3]
+
+    def batch_nearest(self, points, k=3):
+        """
+        nearest() for many (lat, lng) points: one list per point, same order.
+        Repeated points are looked up once, all of them in one
+        utils.batch_nearest call (chunked matrix products + argpartition).
+        """
+        _, stores, _, coords = self._current()
+        out = [[] for _ in points]
+        positions = {}  # (lat, lng) -> indices into points
+        for i, (lat, lng) in enumerate(points):
+            if lat is not None and lng is not None:
+                positions.setdefault((float(lat), float(lng)), []).append(i)
+        if not stores or not positions or k <= 0:
+            return out
+
+        lats, lngs = np.array(list(positions)).T
+        indices, distances = utils.batch_nearest(lats, lngs, coords, k=k)
+        for point_indices, row_idx, row_dist in zip(positions.values(), indices.tolist(), distances.tolist()):
+            hits = [dict(stores[i], distance_m=int(d)) for i, d in zip(row_idx, row_dist)]
+            out[point_indices[0]] = hits
+            for i in point_indices[1:]:
+                out[i] = [dict(h) for h in hits]
+        return out
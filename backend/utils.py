@@ -1,15 +1,25 @@
 # backend/utils.py
 import math
+import re
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371000  # Earth radius in meters
 
 # -------------------------
 # Helper functions
 # -------------------------
 
+def normalize_name(name):
+    """Store name reduced to lowercase letters and digits, for matching duplicate entries"""
+    return re.sub(r"[^a-z0-9]+", "", (name or "").lower())
+
+
 def haversine(lat1, lon1, lat2, lon2):
     """
     Calculate distance in meters between two lat/lng points
     """
-    R = 6371000  # Earth radius in meters
+    R = EARTH_RADIUS_M
     phi1 = math.radians(lat1)
     phi2 = math.radians(lat2)
     delta_phi = math.radians(lat2 - lat1)
@@ -25,16 +35,84 @@ def haversine(lat1, lon1, lat2, lon2):
     return meters
 
 
+def haversine_np(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine (degrees in, meters out). Arguments broadcast like
+    any NumPy ufunc.
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(np.asarray(lon2) - np.asarray(lon1))
+
+    a = np.sin(delta_phi / 2.0) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2.0) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def unit_vectors(lats, lngs):
+    """(N,) lat/lng arrays in degrees -> (N, 3) points on the unit sphere"""
+    phi = np.radians(np.asarray(lats, dtype=np.float64))
+    lam = np.radians(np.asarray(lngs, dtype=np.float64))
+    cos_phi = np.cos(phi)
+    return np.stack([cos_phi * np.cos(lam), cos_phi * np.sin(lam), np.sin(phi)], axis=1)
+
+
+def batch_nearest(user_lats, user_lngs, store_coords, k=3, max_chunk_bytes=64 * 1024 * 1024):
+    """
+    Top-k nearest stores for many users in one call.
+
+    store_coords: (S, 2) array of [lat, lng] in degrees
+    Returns (indices, distances_m), both shaped (U, k) and sorted by distance.
+
+    Candidates are ranked by dot product of unit-sphere vectors (a single
+    matmul per chunk), selected with argpartition, and only the k winners per
+    user get an exact haversine distance. The user axis is processed in chunks
+    so the (chunk, S) score matrix stays under max_chunk_bytes.
+    """
+    user_lats = np.atleast_1d(np.asarray(user_lats, dtype=np.float64))
+    user_lngs = np.atleast_1d(np.asarray(user_lngs, dtype=np.float64))
+    store_coords = np.asarray(store_coords, dtype=np.float64).reshape(-1, 2)
+
+    n_users = user_lats.shape[0]
+    n_stores = store_coords.shape[0]
+    k = min(k, n_stores)
+    indices = np.empty((n_users, k), dtype=np.int64)
+    distances = np.empty((n_users, k), dtype=np.float64)
+    if n_users == 0 or k == 0:
+        return indices, distances
+
+    store_vecs = unit_vectors(store_coords[:, 0], store_coords[:, 1])
+    chunk = max(1, max_chunk_bytes // (n_stores * 8))
+
+    for start in range(0, n_users, chunk):
+        end = min(start + chunk, n_users)
+        lats = user_lats[start:end]
+        lngs = user_lngs[start:end]
+
+        # higher dot product == closer on the sphere
+        scores = unit_vectors(lats, lngs) @ store_vecs.T
+        if k < n_stores:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(n_stores), (end - start, n_stores)).copy()
+
+        dist = haversine_np(lats[:, None], lngs[:, None], store_coords[top, 0], store_coords[top, 1])
+        order = np.argsort(dist, axis=1)
+        indices[start:end] = np.take_along_axis(top, order, axis=1)
+        distances[start:end] = np.take_along_axis(dist, order, axis=1)
+
+    return indices, distances
+
+
 def nearest_stores(lat, lng, stores_list, max_results=3):
     """
     Return nearest stores with distance calculated
     stores_list: list of dicts with 'lat', 'lng', 'name', 'promos'
+    Results are copies; the input dicts are left untouched.
     """
-    for store in stores_list:
-        store_lat = store.get("lat")
-        store_lng = store.get("lng")
-        store["distance_m"] = int(haversine(lat, lng, store_lat, store_lng))
+    if not stores_list:
+        return []
 
-    # sort by distance
-    sorted_stores = sorted(stores_list, key=lambda x: x["distance_m"])
-    return sorted_stores[:max_results]
+    coords = np.array([[s.get("lat"), s.get("lng")] for s in stores_list], dtype=np.float64)
+    idx, dist = batch_nearest([lat], [lng], coords, k=max_results)
+    return [dict(stores_list[i], distance_m=int(d)) for i, d in zip(idx[0], dist[0])]
@@ -0,0 +1,116 @@
+# benchmarks/ann.py
+"""
+Recall / latency / memory benchmark for the RAGIndex index kinds.
+
+Builds every variant from backend.rag.make_index on the same synthetic
+corpus, uses exact Flat search as ground truth and reports recall@k,
+p50/p99 single-query latency and serialized index size.
+
+    python -m benchmarks.ann --n 1000000 --dim 384 --k 10
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+from backend.rag import INDEX_KINDS, make_index, search_params
+
+
+def synthetic_corpus(n, dim, n_clusters=1000, seed=0):
+    """Clustered unit vectors; uniform random data is unrealistically hard for ANN"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype("float32")
+    xb = np.empty((n, dim), dtype="float32")
+    step = 100_000
+    for start in range(0, n, step):
+        end = min(start + step, n)
+        labels = rng.integers(0, n_clusters, end - start)
+        xb[start:end] = centers[labels] + 0.5 * rng.standard_normal((end - start, dim)).astype("float32")
+    faiss.normalize_L2(xb)
+    return xb
+
+
+def index_bytes(index):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.index")
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+
+
+def run_variant(kind, xb, xq, k, gt, nprobe, ef_search, train_size, search_threads):
+    n, dim = xb.shape
+    index, factory = make_index(kind, dim, n)
+
+    build_threads = faiss.omp_get_max_threads()
+    t0 = time.perf_counter()
+    if not index.is_trained:
+        index.train(xb[:train_size])
+    index.add_with_ids(xb, np.arange(n, dtype="int64"))
+    build_s = time.perf_counter() - t0
+
+    # serving searches one query at a time, so measure it that way
+    faiss.omp_set_num_threads(search_threads)
+
+    params = search_params(kind, nprobe, ef_search)
+    latencies = []
+    found = np.empty((len(xq), k), dtype="int64")
+    for i in range(len(xq)):
+        t = time.perf_counter()
+        _, I = index.search(xq[i:i + 1], k, params=params)
+        latencies.append((time.perf_counter() - t) * 1000)
+        found[i] = I[0]
+    faiss.omp_set_num_threads(build_threads)
+
+    recall = float(np.mean([len(set(found[i]) & set(gt[i])) / k for i in range(len(xq))]))
+    return {
+        "kind": kind,
+        "factory": factory,
+        "build_s": round(build_s, 2),
+        f"recall@{k}": round(recall, 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        "index_mb": round(index_bytes(index) / 1e6, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RAGIndex ANN backends against exact search")
+    parser.add_argument("--n", type=int, default=1_000_000, help="corpus size")
+    parser.add_argument("--dim", type=int, default=384, help="vector dimension (all-MiniLM-L6-v2 is 384)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--kinds", default=",".join(INDEX_KINDS))
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--train-size", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, default=1, help="faiss OpenMP threads during search")
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    xb = synthetic_corpus(args.n, args.dim)
+    xq = synthetic_corpus(args.queries, args.dim, seed=1)
+
+    # ground truth with exact search (batched, all threads)
+    flat = faiss.IndexFlatIP(args.dim)
+    flat.add(xb)
+    _, gt = flat.search(xq, args.k)
+    del flat
+
+    results = []
+    for kind in args.kinds.split(","):
+        res = run_variant(kind, xb, xq, args.k, gt, args.nprobe, args.ef_search, args.train_size, args.threads)
+        results.append(res)
+        print(json.dumps(res))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
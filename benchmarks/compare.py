@@ -0,0 +1,96 @@
+# benchmarks/compare.py
+"""
+Compare two benchmark result files (the --out JSON of any benchmark here)
+and flag regressions.
+
+Results are matched on their identifying fields (name, endpoint,
+concurrency, mix, kind, backend). Latencies/durations (`*_ms`, `*_us`,
+`*_s`, p50/p95/p99) should not grow and throughputs (`rps`, `ops_s`,
+`*_per_s`) should not shrink by more than --tolerance.
+
+    python -m benchmarks.compare before.json after.json --tolerance 0.15
+
+Exits with status 1 when anything regressed, so it can gate a deploy.
+"""
+
+import argparse
+import json
+import sys
+
+ID_FIELDS = ("name", "endpoint", "concurrency", "mix", "kind", "backend")
+PERCENTILES = ("p50", "p95", "p99", "mean")
+
+
+def result_id(res):
+    return tuple((f, res[f]) for f in ID_FIELDS if f in res)
+
+
+def flatten(res, prefix=""):
+    """{"a": {"p50": 1}} -> {"a.p50": 1}, numbers only"""
+    out = {}
+    for key, value in res.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            out.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ID_FIELDS:
+            out[path] = value
+    return out
+
+
+def direction(path):
+    """+1 when higher is better, -1 when lower is better, 0 when not a performance number"""
+    parts = path.split(".")
+    leaf = parts[-1]
+    if leaf in ("rps", "ops_s") or "per_s" in leaf:
+        return 1
+    if leaf in PERCENTILES or leaf.endswith(("_ms", "_us", "_s")):
+        return -1
+    if len(parts) > 1 and parts[-2].endswith(("_ms", "_us")):
+        return -1
+    return 0
+
+
+def compare(before, after, tolerance=0.1):
+    """[(result id, metric, before, after, relative change, regressed)]"""
+    old = {result_id(r): flatten(r) for r in before["results"]}
+    rows = []
+    for res in after["results"]:
+        rid = result_id(res)
+        if rid not in old:
+            continue
+        for path, value in flatten(res).items():
+            sign = direction(path)
+            prev = old[rid].get(path)
+            if not sign or not prev:
+                continue
+            change = (value - prev) / abs(prev)
+            rows.append((rid, path, prev, value, change, sign * change < -tolerance))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative change (0.1 = 10%%)")
+    parser.add_argument("--all", action="store_true", help="print every metric, not only regressions")
+    args = parser.parse_args(argv)
+
+    with open(args.before, "r", encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, "r", encoding="utf-8") as f:
+        after = json.load(f)
+
+    regressions = 0
+    for rid, path, prev, value, change, regressed in compare(before, after, args.tolerance):
+        regressions += regressed
+        if regressed or args.all:
+            label = " ".join(f"{k}={v}" for k, v in rid)
+            flag = "REGRESSION" if regressed else "ok"
+            print(f"{flag:10} {label} {path}: {prev:g} -> {value:g} ({change:+.1%})")
+    print(f"{regressions} regression(s) beyond {args.tolerance:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
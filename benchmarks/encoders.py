@@ -0,0 +1,148 @@
+# benchmarks/encoders.py
+"""
+Compare the RAG encoder backends against the fp32 torch baseline.
+
+Each backend runs in a fresh process (so RSS is its own) and reports load
+time, resident memory after loading, single-query encode latency p50/p99,
+batch throughput, and — against the fp32 vectors — mean cosine similarity
+and top-k retrieval agreement (overlap of exact top-k doc sets).
+
+    python -m benchmarks.encoders --backends torch,int8,onnx --docs data/seed_docs
+"""
+
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backend.encoders import DEFAULT_MODEL, get_encoder
+
+WORDS = (
+    "hot cocoa latte espresso tea promo discount coupon store open hours winter seating "
+    "inventory refund policy loyalty points delivery pickup weekend morning cold warm"
+).split()
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # peak, on non-Linux
+
+
+def make_texts(n, min_words, max_words, seed):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))) for _ in range(n)]
+
+
+def load_docs(path, limit):
+    from backend.ingest import chunk_text, discover_files
+
+    docs = []
+    for fpath in discover_files(path):
+        with open(fpath, "r", encoding="utf-8", errors="replace") as f:
+            docs.extend(chunk for _, _, chunk in chunk_text(f.read()))
+        if len(docs) >= limit:
+            break
+    return docs[:limit]
+
+
+def run_backend(backend, model_name, docs, queries, batch_size, latency_queries):
+    """Runs in a child process; returns metrics and the embeddings"""
+    base_rss = rss_mb()
+    t = time.perf_counter()
+    enc = get_encoder(backend, model_name)
+    enc.encode(["warm up"])
+    load_s = time.perf_counter() - t
+    loaded_rss = rss_mb()
+
+    latencies = []
+    for q in queries[:latency_queries]:
+        t = time.perf_counter()
+        enc.encode([q])
+        latencies.append(time.perf_counter() - t)
+
+    t = time.perf_counter()
+    doc_embs = enc.encode(docs, batch_size=batch_size)
+    encode_s = time.perf_counter() - t
+    q_embs = enc.encode(queries, batch_size=batch_size)
+
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 2),
+        "rss_mb": round(loaded_rss, 1),
+        "model_rss_mb": round(loaded_rss - base_rss, 1),
+        "query_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "query_p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+        "docs_per_s": round(len(docs) / encode_s, 1),
+    }, doc_embs, q_embs
+
+
+def top_k(doc_embs, q_embs, k):
+    scores = q_embs @ doc_embs.T
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark RAG encoder backends")
+    parser.add_argument("--backends", default="torch,int8,onnx")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--docs", help="directory of docs to chunk (default: synthetic texts)")
+    parser.add_argument("--n-docs", type=int, default=2000)
+    parser.add_argument("--n-queries", type=int, default=200)
+    parser.add_argument("--latency-queries", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    docs = load_docs(args.docs, args.n_docs) if args.docs else make_texts(args.n_docs, 20, 120, args.seed)
+    queries = make_texts(args.n_queries, 2, 8, args.seed + 1)
+    k = min(args.k, len(docs))
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if backends[0] != "torch":
+        backends = ["torch"] + [b for b in backends if b != "torch"]  # the baseline runs first
+
+    results = []
+    baseline = None
+    ctx = multiprocessing.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            try:
+                res, doc_embs, q_embs = pool.submit(
+                    run_backend, backend, args.model, docs, queries, args.batch_size, args.latency_queries
+                ).result()
+            except Exception as e:
+                res = {"backend": backend, "error": str(e)}
+                results.append(res)
+                print(json.dumps(res))
+                continue
+
+        if baseline is None:
+            baseline = (doc_embs, q_embs, top_k(doc_embs, q_embs, k))
+        base_docs, _, base_top = baseline
+        ours = top_k(doc_embs, q_embs, k)
+        overlap = [len(set(a) & set(b)) / k for a, b in zip(ours, base_top)]
+        res["mean_cosine_vs_fp32"] = round(float(np.mean(np.sum(doc_embs * base_docs, axis=1))), 5)
+        res[f"top{k}_agreement"] = round(float(np.mean(overlap)), 4)
+        results.append(res)
+        print(json.dumps(res))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
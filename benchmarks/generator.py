@@ -0,0 +1,94 @@
+# benchmarks/generator.py
+"""
+Throughput of the batched local generator at different concurrency levels.
+
+Each level fires `--requests` prompts from `concurrency` client threads and
+reports generated tokens/sec, requests/sec and p50/p99 request latency.
+
+    python -m benchmarks.generator --levels 1,2,4,8,16 --max-new-tokens 64
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from backend.generator import LocalGenerator, build_prompt
+
+SAMPLE_CONTEXT = (
+    "Nearby stores:\n- Starbucks Main St (50m away) | Promos: 10% off Hot Cocoa\n"
+    "- Cafe Nero Central (120m away) | Promos: 5% off Latte\n"
+    "Past purchases:\n- Starbucks Main St at 2025-11-30 | Hot Cocoa\n"
+)
+SAMPLE_MESSAGES = ["I'm cold", "any coffee deals?", "where can I get a latte", "is Starbucks open?"]
+
+
+def run_level(gen, concurrency, n_requests, max_new_tokens):
+    prompts = [build_prompt(SAMPLE_MESSAGES[i % len(SAMPLE_MESSAGES)], SAMPLE_CONTEXT) for i in range(n_requests)]
+    latencies = []
+
+    def one(prompt):
+        t = time.perf_counter()
+        gen.generate(prompt, max_new_tokens=max_new_tokens)
+        latencies.append(time.perf_counter() - t)
+
+    tokens_before = gen.stats["generated_tokens"]
+    batches_before = gen.stats["batches"]
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, prompts))
+    elapsed = time.perf_counter() - t0
+    tokens = gen.stats["generated_tokens"] - tokens_before
+    batches = gen.stats["batches"] - batches_before
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "tokens_per_s": round(tokens / elapsed, 1),
+        "requests_per_s": round(n_requests / elapsed, 2),
+        "mean_batch": round(n_requests / batches, 2) if batches else 0,
+        "p50_s": round(float(np.percentile(latencies, 50)), 3),
+        "p99_s": round(float(np.percentile(latencies, 99)), 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark batched local generation throughput")
+    parser.add_argument("--model", default="gpt2")
+    parser.add_argument("--dtype", default="fp32", choices=("fp32", "bf16"))
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per level")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10.0)
+    parser.add_argument("--max-new-tokens", type=int, default=64)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    gen = LocalGenerator(
+        model_name=args.model,
+        dtype=args.dtype,
+        num_threads=args.threads,
+        max_batch=args.max_batch,
+        max_wait_ms=args.max_wait_ms,
+        max_queue=max(64, args.requests),
+        max_new_tokens=args.max_new_tokens,
+    )
+    gen.load()
+    gen.generate("warm up", max_new_tokens=4)
+
+    results = []
+    for level in (int(x) for x in args.levels.split(",")):
+        res = run_level(gen, level, args.requests, args.max_new_tokens)
+        results.append(res)
+        print(json.dumps(res))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
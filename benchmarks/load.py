@@ -0,0 +1,296 @@
+# benchmarks/load.py
+"""
+Offline load test of backend.main:app.
+
+Starts the stub LLM (benchmarks.stub_llm) and the app under uvicorn on free
+local ports, pointed at a synthetic data set (benchmarks.synthetic) through
+STORES_FILE / SEED_DOCS_DIR / DB_FILE / RAG_INDEX_PATH, then replays chat
+requests at each concurrency level and reports requests/s, latency
+p50/p95/p99 and the per-stage breakdown from the X-Debug-Timings header.
+
+    python -m benchmarks.load --concurrency 1,8,32 --requests 500 --out load.json
+    python -m benchmarks.load --endpoint stream --stub-latency-ms 500 --stub-token-ms 20
+    python -m benchmarks.load --url http://127.0.0.1:8000 --replay my_requests.jsonl
+    python -m benchmarks.load --endpoint batch --batch-size 500 --concurrency 1,4
+    python -m benchmarks.load --stub-error-rate 0.1  # error path: failed LLM calls show up as errors
+
+With --endpoint batch every request posts --batch-size workload items to
+/api/chat/batch; items_per_s and ms_per_item compare with the chat endpoint.
+
+--url drives an app that is already running (no stub, no data set). The run
+writes purchases and users into the data set's users.db, and the first run
+on a data set builds its index (allow for it in --ready-timeout).
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import httpx
+import numpy as np
+
+from benchmarks import synthetic
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _log_tail(path, n=20):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        return "".join(f.readlines()[-n:])
+
+
+def wait_ready(url, proc, timeout, log_path):
+    """Poll url until it answers 200; fail early (with the log tail) if proc exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{' '.join(proc.args)} exited with status {proc.returncode}:\n{_log_tail(log_path)}")
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def app_env(data, stub_url, args):
+    env = dict(
+        os.environ,
+        GROQ_API_URL=stub_url,
+        GROQ_API_KEY="bench",
+        GROQ_MODEL_NAME="stub",
+        LLM_BACKEND="groq",
+        STORES_FILE=os.path.join(data, "stores.json"),
+        SEED_DOCS_DIR=os.path.join(data, "seed_docs"),
+        DB_FILE=os.path.join(data, "users.db"),
+        RAG_INDEX_PATH=os.path.join(data, "faiss_index.index"),
+        RAG_META_PATH=os.path.join(data, "meta.db"),
+        RESPONSE_CACHE="memory" if args.response_cache else "off",
+        DEBUG_TIMINGS="always",
+    )
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+@contextmanager
+def local_stack(data, args, log_dir):
+    """Stub LLM + app subprocesses; yields the app's base URL"""
+    stub_port, app_port = free_port(), free_port()
+    procs = []
+    try:
+        stub_log_path, app_log_path = os.path.join(log_dir, "stub.log"), os.path.join(log_dir, "app.log")
+        with open(stub_log_path, "wb") as stub_log, open(app_log_path, "wb") as app_log:
+            stub = subprocess.Popen([
+                sys.executable, "-m", "benchmarks.stub_llm", "--port", str(stub_port),
+                "--latency-ms", str(args.stub_latency_ms), "--jitter-ms", str(args.stub_jitter_ms),
+                "--tokens", str(args.stub_tokens), "--token-ms", str(args.stub_token_ms),
+                "--error-rate", str(args.stub_error_rate),
+            ], stdout=stub_log, stderr=subprocess.STDOUT)
+            procs.append(stub)
+            stub_url = f"http://127.0.0.1:{stub_port}"
+            wait_ready(stub_url + "/health", stub, 30, stub_log_path)
+
+            app = subprocess.Popen([
+                sys.executable, "-m", "uvicorn", "backend.main:app", "--host", "127.0.0.1",
+                "--port", str(app_port), "--workers", str(args.workers), "--log-level", "warning",
+            ], env=app_env(data, stub_url, args), stdout=app_log, stderr=subprocess.STDOUT)
+            procs.append(app)
+            app_url = f"http://127.0.0.1:{app_port}"
+            wait_ready(app_url + "/ready", app, args.ready_timeout, app_log_path)
+            yield app_url
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+# -------------------------
+# Load driver
+# -------------------------
+def parse_timings(header):
+    """X-Debug-Timings "stage=1.23ms, ..." -> {stage: ms}"""
+    out = {}
+    for item in (header or "").split(","):
+        stage, _, value = item.strip().partition("=")
+        if value.endswith("ms"):
+            out[stage] = float(value[:-2])
+    return out
+
+
+async def one_request(client, url, endpoint, body):
+    started = time.perf_counter()
+    sample = {"ttft": None}
+    if endpoint == "stream":
+        async with client.stream("POST", url + "/api/chat/stream", json=body) as r:
+            sample["status"] = r.status_code
+            sample["stages"] = parse_timings(r.headers.get("x-debug-timings"))
+            async for line in r.aiter_lines():
+                if sample["ttft"] is None and line == "event: token":
+                    sample["ttft"] = time.perf_counter() - started
+                if line.startswith("event: error"):
+                    sample["status"] = 599
+    elif endpoint == "batch":
+        r = await client.post(url + "/api/chat/batch", json=body)
+        sample["status"] = r.status_code
+        sample["stages"] = {}
+        sample["items"] = len(body["items"])
+        sample["item_errors"] = sum("error" in json.loads(line) for line in r.text.splitlines())
+    else:
+        r = await client.post(url + "/api/chat", json=body)
+        sample["status"] = r.status_code
+        sample["stages"] = parse_timings(r.headers.get("x-debug-timings"))
+        if r.status_code == 200 and r.json().get("reply", "").startswith("Error generating response"):
+            sample["status"] = 599  # the endpoint reports LLM failures in a 200
+    sample["latency"] = time.perf_counter() - started
+    return sample
+
+
+async def run_level(url, endpoint, bodies, concurrency, n_requests, timeout):
+    counter = itertools.count()
+    samples = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker():
+            while (i := next(counter)) < n_requests:
+                try:
+                    samples.append(await one_request(client, url, endpoint, bodies[i % len(bodies)]))
+                except httpx.HTTPError:
+                    samples.append({"status": 0, "latency": timeout, "ttft": None, "stages": {}})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return samples, elapsed
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "mean": round(float(values.mean()), 2),
+    }
+
+
+def summarize(endpoint, concurrency, samples, elapsed):
+    ok = [s for s in samples if s["status"] == 200]
+    stages = {}
+    for s in ok:
+        for stage, ms in s["stages"].items():
+            stages.setdefault(stage, []).append(ms / 1000)
+    res = {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(ok),
+        "duration_s": round(elapsed, 2),
+        "rps": round(len(ok) / elapsed, 2),
+        "latency_ms": percentiles([s["latency"] for s in ok]),
+        "stages_ms": {stage: percentiles(v) for stage, v in sorted(stages.items())},
+    }
+    if endpoint == "stream":
+        res["ttft_ms"] = percentiles([s["ttft"] for s in ok if s["ttft"] is not None])
+    if endpoint == "batch":
+        items = sum(s["items"] for s in ok)
+        res["item_errors"] = sum(s["item_errors"] for s in ok)
+        res["items_per_s"] = round(items / elapsed, 2)
+        res["ms_per_item"] = round(elapsed * 1000 / items, 3) if items else None
+    return res
+
+
+def load_bodies(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def batch_bodies(bodies, size):
+    items = [{k: b[k] for k in ("user_id", "message", "location") if k in b} for b in bodies]
+    return [{"items": items[i:i + size]} for i in range(0, len(items), size)]
+
+
+def drive(url, bodies, args):
+    if args.endpoint == "batch":
+        bodies = batch_bodies(bodies, args.batch_size)
+    results = []
+    if args.warmup:
+        asyncio.run(run_level(url, args.endpoint, bodies, 1, args.warmup, args.timeout))
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        samples, elapsed = asyncio.run(
+            run_level(url, args.endpoint, bodies, concurrency, args.requests, args.timeout)
+        )
+        res = summarize(args.endpoint, concurrency, samples, elapsed)
+        results.append(res)
+        print(json.dumps(res))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test of the chat pipeline")
+    parser.add_argument("--url", help="drive an already running app instead of starting one")
+    parser.add_argument("--data", help="benchmarks.synthetic directory (default: generate one in a temp dir)")
+    parser.add_argument("--replay", help="JSONL of /api/chat request bodies (default: the data set's workload.jsonl)")
+    parser.add_argument("--endpoint", choices=("chat", "stream", "batch"), default="chat")
+    parser.add_argument("--batch-size", type=int, default=256, help="items per /api/chat/batch request")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per level")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--response-cache", action="store_true", help="keep the semantic response cache on")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the app, e.g. RAG_MODE=dense (repeatable)")
+    parser.add_argument("--stub-latency-ms", type=float, default=300.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--stub-tokens", type=int, default=40)
+    parser.add_argument("--stub-token-ms", type=float, default=15.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="fraction of LLM calls the stub fails with a 500")
+    parser.add_argument("--stores", type=int, default=500, help="synthetic data set size when --data is not given")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--purchases", type=int, default=20_000)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="bench-load-") as tmp:
+        if args.url:
+            if not args.replay:
+                parser.error("--url needs --replay")
+            results = drive(args.url.rstrip("/"), load_bodies(args.replay), args)
+        else:
+            data = args.data or synthetic.generate(
+                os.path.join(tmp, "data"), args.stores, args.users, args.purchases, args.docs
+            )
+            bodies = load_bodies(args.replay or os.path.join(data, "workload.jsonl"))
+            with local_stack(data, args, tmp) as url:
+                results = drive(url, bodies, args)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# benchmarks/micro.py
+"""
+Microbenchmarks of the per-request building blocks on a synthetic data set:
+
+    stores  StoreCatalog.nearest / within_radius, utils.nearest_stores (linear scan)
+    rag     RAGIndex.retrieve: uncached, cached and store-filtered
+    pii     mask_pii on chat messages (some with an email / phone number)
+    db      create_user, add_purchase (+ commit), get_user_profile,
+            get_purchases_for_user
+
+Reports calls/s and p50/p95/p99 µs per call. Save with --out and diff two
+runs with benchmarks.compare.
+
+    python -m benchmarks.micro --data /tmp/bench-data --out micro.json
+    python -m benchmarks.micro --only stores,pii
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import synthetic
+
+GROUPS = ("stores", "rag", "pii", "db")
+
+
+def time_calls(name, fn, inputs, iterations, warmup=10):
+    """Call fn(*args) for `iterations` args cycled from inputs; per-call latency stats"""
+    for i in range(min(warmup, iterations)):
+        fn(*inputs[i % len(inputs)])
+    latencies = np.empty(iterations)
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(*inputs[i % len(inputs)])
+        latencies[i] = time.perf_counter() - t
+    elapsed = time.perf_counter() - started
+    return {
+        "name": name,
+        "calls": iterations,
+        "ops_s": round(iterations / elapsed, 1),
+        "p50_us": round(float(np.percentile(latencies, 50)) * 1e6, 2),
+        "p95_us": round(float(np.percentile(latencies, 95)) * 1e6, 2),
+        "p99_us": round(float(np.percentile(latencies, 99)) * 1e6, 2),
+    }
+
+
+def load_workload(data, n):
+    with open(os.path.join(data, "workload.jsonl"), "r", encoding="utf-8") as f:
+        return [json.loads(line) for line, _ in zip(f, range(n))]
+
+
+# -------------------------
+# Groups
+# -------------------------
+def bench_stores(data, workload, args):
+    from backend.stores import StoreCatalog
+    from backend.utils import nearest_stores
+
+    catalog = StoreCatalog(os.path.join(data, "stores.json"))
+    len(catalog)  # load outside the timings
+    with open(os.path.join(data, "stores.json"), "r", encoding="utf-8") as f:
+        stores_list = json.load(f)
+    points = [(r["location"]["lat"], r["location"]["lng"]) for r in workload]
+    return [
+        time_calls("stores.nearest", lambda lat, lng: catalog.nearest(lat, lng, k=3), points, args.iterations),
+        time_calls("utils.nearest_stores", lambda lat, lng: nearest_stores(lat, lng, stores_list, max_results=3),
+                   points, args.iterations),
+        time_calls("stores.within_radius",
+                   lambda lat, lng: catalog.within_radius(lat, lng, 25_000, limit=200), points, args.iterations),
+    ]
+
+
+def bench_rag(data, workload, args, tmp):
+    from backend.ingest import ingest
+    from backend.rag import RAGIndex
+    from backend.stores import StoreCatalog
+
+    paths = dict(index_path=os.path.join(tmp, "bench.index"), meta_path=os.path.join(tmp, "bench_meta.db"))
+    rag = RAGIndex(**paths, mode=args.rag_mode, encoder=args.encoder)
+    ingest(rag, os.path.join(data, "seed_docs"), full=True, log=lambda *a, **k: None)
+    uncached = RAGIndex(**paths, mode=args.rag_mode, encoder=rag.encoder, query_cache_size=0, result_cache_size=0)
+    uncached.load()
+
+    catalog = StoreCatalog(os.path.join(data, "stores.json"))
+    queries = [(r["message"],) for r in workload]
+    filtered = []
+    for r in workload[:200]:
+        nearby = catalog.within_radius(r["location"]["lat"], r["location"]["lng"], 25_000, limit=200)
+        filtered.append((r["message"], {"store_ids": [s["store_id"] for s in nearby]}))
+    n = max(1, args.iterations // 10)  # each call encodes a query
+    return [
+        time_calls("rag.retrieve_uncached", lambda q: uncached.retrieve(q, k=5), queries, n),
+        time_calls("rag.retrieve_cached", lambda q: rag.retrieve(q, k=5), queries[:50], args.iterations),
+        time_calls("rag.retrieve_filtered", lambda q, f: uncached.retrieve(q, k=5, filters=f), filtered, n),
+    ]
+
+
+def bench_pii(data, workload, args):
+    from backend.pii import mask_pii
+
+    rng = random.Random(args.seed)
+    messages = [r["message"] for r in workload]
+    messages += [f"call me on (415) 555-{rng.randint(1000, 9999)} about {m}" for m in messages[:len(messages) // 10]]
+    return [time_calls("pii.mask_pii", mask_pii, [(m,) for m in messages], args.iterations)]
+
+
+def bench_db(data, workload, args):
+    # DB_FILE is set by main() before this import
+    from backend import db
+
+    db.init_db()
+    users = sorted({r["user_id"] for r in workload})
+    known = [(u,) for u in users]
+    fresh = [(f"bench_new_{i}",) for i in range(args.iterations + 10)]
+    purchases = [(r["user_id"], "Starbucks Main St", "Latte", 4.5) for r in workload]
+
+    results = [
+        time_calls("db.create_user_existing", db.create_user, known, args.iterations),
+        time_calls("db.create_user_new", db.create_user, fresh, args.iterations),
+        time_calls("db.add_purchase", db.add_purchase, purchases, args.iterations),
+    ]
+    started = time.perf_counter()
+    db.purchase_writer.flush()
+    results.append({"name": "db.purchase_commit_flush", "flush_s": round(time.perf_counter() - started, 4)})
+    results += [
+        time_calls("db.get_user_profile", db.get_user_profile, known, args.iterations),
+        time_calls("db.get_purchases_for_user", db.get_purchases_for_user, known, args.iterations),
+    ]
+    db.purchase_writer.stop()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks of the chat pipeline building blocks")
+    parser.add_argument("--data", help="benchmarks.synthetic directory (default: generate a small one)")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"comma separated subset of {GROUPS}")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--rag-mode", default="hybrid")
+    parser.add_argument("--encoder", default="torch")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="bench-micro-")
+    try:
+        data = args.data or synthetic.generate(os.path.join(tmp, "data"), seed=args.seed)
+        if os.path.exists(os.path.join(data, "users.db")):
+            shutil.copy(os.path.join(data, "users.db"), os.path.join(tmp, "users.db"))  # runs don't mutate --data
+        os.environ["DB_FILE"] = os.path.join(tmp, "users.db")
+        workload = load_workload(data, 2000)
+
+        results = []
+        for group in args.only.split(","):
+            if group == "stores":
+                group_results = bench_stores(data, workload, args)
+            elif group == "rag":
+                group_results = bench_rag(data, workload, args, tmp)
+            elif group == "pii":
+                group_results = bench_pii(data, workload, args)
+            elif group == "db":
+                group_results = bench_db(data, workload, args)
+            else:
+                raise SystemExit(f"Unknown group {group!r}, expected some of {GROUPS}")
+            for res in group_results:
+                print(json.dumps(res))
+            results += group_results
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# benchmarks/pii.py
+"""
+Microbenchmark of the PII masking engine against the two maskers it replaced
+(kept here verbatim as references).
+
+The corpus mixes chat-like messages without PII (the common case), with an
+email, with a phone number and with both. Reports µs/message per mix.
+
+    python -m benchmarks.pii --messages 20000
+"""
+
+import argparse
+import json
+import random
+import re
+import time
+
+import phonenumbers
+from phonenumbers.phonenumberutil import NumberParseException
+
+from backend import pii, pii_masker
+
+
+# -------------------------
+# Previous implementations
+# -------------------------
+_old_email_re = re.compile(r"[\w\.-]+@[\w\.-]+")
+
+
+def old_pii_mask(text):
+    out = _old_email_re.sub(pii.EMAIL_PLACEHOLDER, text)
+    res = out
+    try:
+        for match in phonenumbers.PhoneNumberMatcher(out, "US"):
+            res = res.replace(match.raw_string, pii.PHONE_PLACEHOLDER)
+    except NumberParseException:
+        pass
+    return res
+
+
+_OLD_EMAIL = re.compile(r"[a-zA-Z0-9.+_-]+@[a-zA-Z0-9._-]+\.[a-zA-Z0-9._-]+")
+_OLD_PHONE = re.compile(r"(?:\+?\d{1,3})?[-. (]*\d{3}[-. )]*\d{3}[-. ]*\d{4}")
+
+
+def old_pii_masker_mask(text):
+    if not text:
+        return text
+
+    def repl(match):
+        name, domain = match.group(0).split("@")
+        return f"{name[0]}***@{domain}"
+
+    text = _OLD_EMAIL.sub(repl, text)
+    for m in _OLD_PHONE.findall(text):
+        digits = re.sub(r"\D", "", m)
+        if len(digits) < 4:
+            continue
+        text = text.replace(m, "*" * (len(digits) - 2) + digits[-2:])
+    return text
+
+
+IMPLEMENTATIONS = {
+    "old_pii": old_pii_mask,
+    "old_pii_masker": old_pii_masker_mask,
+    "pii": pii.mask_pii,
+    "pii_masker": pii_masker.mask_pii,
+}
+
+PLAIN = [
+    "I'm cold, anything warm nearby?",
+    "where can I get a latte",
+    "is Starbucks on Main Street open right now?",
+    "any deals on hot chocolate today",
+]
+EMAILS = ["john.doe@example.com", "a.smith+promo@shop.co.uk"]
+PHONES = ["+1 650-253-0000", "(415) 555-2671", "+44 20 7946 0958"]
+
+
+def make_corpus(n, mix, seed=0):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        msg = rng.choice(PLAIN)
+        if mix in ("email", "both"):
+            msg += f" mail me at {rng.choice(EMAILS)}"
+        if mix in ("phone", "both"):
+            msg += f" or call {rng.choice(PHONES)}"
+        out.append(msg)
+    return out
+
+
+def time_impl(fn, corpus, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        for msg in corpus:
+            fn(msg)
+        best = min(best, time.perf_counter() - t)
+    return best / len(corpus) * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PII masking")
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    results = []
+    for mix in ("plain", "email", "phone", "both"):
+        corpus = make_corpus(args.messages, mix)
+        res = {"mix": mix}
+        for name, fn in IMPLEMENTATIONS.items():
+            res[f"{name}_us"] = round(time_impl(fn, corpus, args.repeat), 2)
+        results.append(res)
+        print(json.dumps(res))
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# benchmarks/stub_llm.py
+"""
+Local stand-in for the Groq generate API, so the chat pipeline can be load
+tested without network access or a model.
+
+Serves POST /models/{model}/generate like the real endpoint: a JSON
+{"text": ...} reply after --latency-ms (± --jitter-ms), or with "stream":
+true, SSE `data: {"text": ...}` tokens every --token-ms after the same first
+token latency, then `data: [DONE]`. Point the app at it with
+GROQ_API_URL=http://127.0.0.1:<port>.
+
+    python -m benchmarks.stub_llm --port 9100 --latency-ms 300 --tokens 40 --token-ms 15
+"""
+
+import argparse
+import asyncio
+import json
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY_WORDS = "Try the Hot Cocoa at Starbucks Main St, it is 50m away and 10% off today with code COCO10".split()
+
+app = FastAPI(title="Stub LLM")
+app.state.config = {"latency_ms": 300.0, "jitter_ms": 50.0, "tokens": 40, "token_ms": 15.0, "error_rate": 0.0}
+app.state.calls = 0
+
+
+def _delay(config):
+    return max(0.0, config["latency_ms"] + random.uniform(-1, 1) * config["jitter_ms"]) / 1000.0
+
+
+def _reply_tokens(n):
+    return [REPLY_WORDS[i % len(REPLY_WORDS)] + " " for i in range(n)]
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "calls": app.state.calls, **app.state.config}
+
+
+@app.post("/models/{model}/generate")
+async def generate(model: str, request: Request):
+    config = app.state.config
+    payload = await request.json()
+    app.state.calls += 1
+    if random.random() < config["error_rate"]:
+        return JSONResponse({"error": "stub failure"}, status_code=500)
+    tokens = _reply_tokens(min(config["tokens"], payload.get("max_output_tokens") or config["tokens"]))
+
+    if not payload.get("stream"):
+        await asyncio.sleep(_delay(config) + len(tokens) * config["token_ms"] / 1000.0)
+        return {"text": "".join(tokens).strip()}
+
+    async def events():
+        await asyncio.sleep(_delay(config))
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(config["token_ms"] / 1000.0)
+            yield f"data: {json.dumps({'text': token})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main(argv=None):
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub LLM server for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per reply")
+    parser.add_argument("--token-ms", type=float, default=15.0, help="time between tokens")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with a 500")
+    args = parser.parse_args(argv)
+
+    app.state.config = {
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "tokens": args.tokens,
+        "token_ms": args.token_ms,
+        "error_rate": args.error_rate,
+    }
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
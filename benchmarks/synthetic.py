@@ -0,0 +1,169 @@
+# benchmarks/synthetic.py
+"""
+Synthetic data set for the load test and microbenchmarks.
+
+Writes into one directory:
+
+    stores.json       N stores scattered around a city centre
+    seed_docs/        D docs, each tied to a store (sidecar .meta.json) or global
+    purchases.jsonl   P purchases spread over M users (bulk_import format)
+    workload.jsonl    chat request bodies for benchmarks.load to replay
+    users.db          the purchases imported, profiles built (unless --no-db)
+
+    python -m benchmarks.synthetic /tmp/bench-data --stores 2000 --users 10000 --purchases 200000 --docs 2000
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+CENTER = (12.9716, 77.5946)
+BRANDS = ["Starbucks", "Cafe Nero", "Blue Tokai", "Third Wave", "Costa", "Chai Point", "Dunkin", "Tim Hortons"]
+STREETS = ["Main St", "Central", "MG Road", "Church St", "Indiranagar", "Koramangala", "Jayanagar", "Whitefield"]
+CATEGORIES = ["Hot Cocoa", "Latte", "Espresso", "Cappuccino", "Masala Chai", "Green Tea", "Croissant", "Muffin"]
+DOC_TYPES = ["promo", "faq", "policy"]
+MESSAGES = [
+    "I'm cold", "any coffee deals near me?", "where can I get a latte", "is {store} open?",
+    "what promos does {store} have", "I want something warm to drink", "cheap snacks nearby",
+    "do you have {item} in stock", "best place for {item}", "my email is jo@example.com, any coupons?",
+]
+
+
+def jitter(lat, lng, radius_m, rng):
+    """A point uniformly distributed within radius_m of (lat, lng)"""
+    r = radius_m * math.sqrt(rng.random())
+    theta = rng.random() * 2 * math.pi
+    dlat = r * math.cos(theta) / 111_320
+    dlng = r * math.sin(theta) / (111_320 * math.cos(math.radians(lat)))
+    return round(lat + dlat, 6), round(lng + dlng, 6)
+
+
+def make_stores(n, rng, radius_m=20_000):
+    stores = []
+    for i in range(n):
+        lat, lng = jitter(*CENTER, radius_m, rng)
+        item = rng.choice(CATEGORIES)
+        stores.append({
+            "store_id": f"store_{i:06d}",
+            "name": f"{rng.choice(BRANDS)} {rng.choice(STREETS)} {i}",
+            "lat": lat,
+            "lng": lng,
+            "open": rng.random() > 0.1,
+            "promos": [{"code": f"P{i}", "desc": f"{rng.choice([5, 10, 15, 20])}% off {item}", "expires": "2030-01-01"}],
+            "inventory": {c: rng.randint(0, 50) for c in rng.sample(CATEGORIES, 3)},
+        })
+    return stores
+
+
+def make_doc(store, doc_type, rng):
+    item = rng.choice(CATEGORIES)
+    if doc_type == "promo":
+        promo = store["promos"][0]
+        return f"{store['name']} offers {promo['desc']} with code {promo['code']} (expires {promo['expires']})."
+    if doc_type == "faq":
+        return (f"{store['name']} is open {rng.randint(6, 9)}am to {rng.randint(8, 11)}pm, has "
+                f"{rng.choice(['indoor seating', 'a drive-through', 'free wifi'])} and usually stocks {item}.")
+    return (f"Refunds at {store['name']} are accepted within {rng.choice([7, 14, 30])} days with a receipt. "
+            f"Loyalty points apply to {item}.")
+
+
+def write_docs(path, stores, n, rng, global_share=0.1):
+    os.makedirs(path, exist_ok=True)
+    for i in range(n):
+        doc_type = rng.choice(DOC_TYPES)
+        name = os.path.join(path, f"doc_{i:06d}.txt")
+        if rng.random() < global_share:
+            text, meta = f"Company {doc_type}: {make_doc(rng.choice(stores), doc_type, rng)}", {"doc_type": doc_type}
+        else:
+            store = rng.choice(stores)
+            text, meta = make_doc(store, doc_type, rng), {"store_id": store["store_id"], "doc_type": doc_type}
+        with open(name, "w", encoding="utf-8") as f:
+            f.write(text)
+        with open(name + ".meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+
+def user_ids(m):
+    return [f"user_{i:07d}" for i in range(m)]
+
+
+def write_purchases(path, stores, users, n, rng, days=90):
+    now = datetime.utcnow()
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(n):
+            store = rng.choice(stores)
+            f.write(json.dumps({
+                "user_id": rng.choice(users),
+                "store_name": store["name"],
+                "category": rng.choice(CATEGORIES),
+                "amount": round(rng.uniform(2, 15), 2),
+                "timestamp": (now - timedelta(seconds=rng.uniform(0, days * 86400))).isoformat(),
+            }) + "\n")
+
+
+def make_request(stores, users, rng, track_share=0.1):
+    store = rng.choice(stores)
+    lat, lng = jitter(store["lat"], store["lng"], 500, rng)
+    req = {
+        "message": rng.choice(MESSAGES).format(store=store["name"], item=rng.choice(CATEGORIES)),
+        "user_id": rng.choice(users),
+        "location": {"lat": lat, "lng": lng},
+    }
+    if rng.random() < track_share:
+        req["track_purchase"] = {"store_name": store["name"], "category": rng.choice(CATEGORIES), "amount": 4.5}
+    return req
+
+
+def write_workload(path, stores, users, n, rng):
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(n):
+            f.write(json.dumps(make_request(stores, users, rng)) + "\n")
+
+
+def import_purchases(out):
+    """Load purchases.jsonl into out/users.db with backend.bulk_import (DB_FILE is read at import time)"""
+    env = dict(os.environ, DB_FILE=os.path.join(out, "users.db"))
+    subprocess.run(
+        [sys.executable, "-m", "backend.bulk_import", os.path.join(out, "purchases.jsonl")],
+        env=env, check=True, stdout=subprocess.DEVNULL,
+    )
+
+
+def generate(out, stores=500, users=2000, purchases=20_000, docs=500, requests=2000, seed=0, db=True):
+    rng = random.Random(seed)
+    os.makedirs(out, exist_ok=True)
+    catalog = make_stores(stores, rng)
+    with open(os.path.join(out, "stores.json"), "w", encoding="utf-8") as f:
+        json.dump(catalog, f)
+    write_docs(os.path.join(out, "seed_docs"), catalog, docs, rng)
+    users_ = user_ids(users)
+    write_purchases(os.path.join(out, "purchases.jsonl"), catalog, users_, purchases, rng)
+    write_workload(os.path.join(out, "workload.jsonl"), catalog, users_, requests, rng)
+    if db:
+        import_purchases(out)
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic benchmark data set")
+    parser.add_argument("out", help="output directory")
+    parser.add_argument("--stores", type=int, default=500)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--purchases", type=int, default=20_000)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=2000, help="chat requests in workload.jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-db", action="store_true", help="don't import the purchases into users.db")
+    args = parser.parse_args(argv)
+
+    generate(args.out, args.stores, args.users, args.purchases, args.docs, args.requests, args.seed, db=not args.no_db)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()